@@ -0,0 +1,74 @@
+"""
+Throughput of concurrent "claim next packages" calls.
+
+Registers and costs a pool of packages for a fresh user, then lets
+several companies claim them at once through the repository until
+nothing is left. Needs a scratch MySQL database from the settings. Run with
+``python -m app.benchmarks.claim_packages``.
+"""
+import argparse
+import asyncio
+from datetime import datetime
+from time import perf_counter
+from uuid import uuid4
+
+from app.core.settings import settings
+from app.infrastructure.models import engine, get_sessionmaker
+from app.infrastructure.mysql_repository import DeltaMySQLRepository
+from app.schemas import PackageCreate
+
+
+async def prepare(repository: DeltaMySQLRepository, count: int) -> None:
+    user_id = str(uuid4())
+    await repository.upsert_users({user_id: datetime.now()})
+    package_ids = await repository.register_packages(
+        [
+            PackageCreate(
+                name="Benchmark package", weight=1.5, content_value=100.0, type_id=1
+            )
+        ]
+        * count,
+        user_id,
+    )
+    packages_to_calc = await repository.get_packages_to_calc_by_ids(package_ids)
+    for package in packages_to_calc:
+        package.delivery_cost = 1.0
+    await repository.update_delivery_costs(packages_to_calc)
+
+
+async def claimer(repository: DeltaMySQLRepository, company_id: int, limit: int) -> int:
+    claimed = 0
+    while packages := await repository.claim_packages(company_id, limit):
+        claimed += len(packages)
+    return claimed
+
+
+async def main(count: int, limit: int, claimers: list[int]) -> None:
+    repository = DeltaMySQLRepository(
+        config=settings.storage_url, sessionmaker=get_sessionmaker()
+    )
+    print(f"{'claimers':>10} {'packages':>10} {'seconds':>10} {'pkg/s':>10}")
+    for concurrency in claimers:
+        await prepare(repository, count)
+        started = perf_counter()
+        claimed = await asyncio.gather(
+            *(
+                claimer(repository, company_id, limit)
+                for company_id in range(1, concurrency + 1)
+            )
+        )
+        elapsed = perf_counter() - started
+        print(
+            f"{concurrency:>10} {sum(claimed):>10} {elapsed:>10.2f} "
+            f"{sum(claimed) / elapsed:>10,.0f}"
+        )
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--claimers", type=int, nargs="+", default=[1, 4, 12])
+    args = parser.parse_args()
+    asyncio.run(main(args.count, args.limit, args.claimers))
@@ -0,0 +1,66 @@
+"""
+Micro-benchmark of the delivery cost kernel.
+
+Run with ``python -m app.benchmarks.delivery_cost_kernel``.
+"""
+from datetime import datetime
+from time import perf_counter
+
+import numpy as np
+
+from app.services.use_cases.delivery_cost_kernel import (
+    build_calculation_logs,
+    calculate_delivery_costs,
+    PackageColumns,
+)
+
+SIZES = (10_000, 100_000, 1_000_000)
+RATE = 92.5058
+
+
+def make_columns(size: int) -> PackageColumns:
+    generator = np.random.default_rng(size)
+    return PackageColumns(
+        ids=np.arange(1, size + 1, dtype=np.int64),
+        type_ids=generator.integers(1, 4, size, dtype=np.int64),
+        weights=generator.uniform(0.01, 500, size),
+        content_values=generator.uniform(0.01, 100000, size),
+    )
+
+
+def scalar_costs(columns: PackageColumns, rate: float) -> list[float]:
+    return [
+        (weight * 0.5 + content_value * 0.01) * rate
+        for weight, content_value in zip(
+            columns.weights.tolist(), columns.content_values.tolist()
+        )
+    ]
+
+
+def measure(func, *args) -> float:
+    started = perf_counter()
+    func(*args)
+    return perf_counter() - started
+
+
+def main() -> None:
+    print(
+        f"{'rows':>10} {'scalar pkg/s':>15} {'kernel pkg/s':>15} "
+        f"{'kernel+logs pkg/s':>18}"
+    )
+    for size in SIZES:
+        columns = make_columns(size)
+        scalar = measure(scalar_costs, columns, RATE)
+        kernel = measure(
+            calculate_delivery_costs, columns.weights, columns.content_values, RATE
+        )
+        costs = calculate_delivery_costs(columns.weights, columns.content_values, RATE)
+        logs = measure(build_calculation_logs, columns, costs, datetime.now())
+        print(
+            f"{size:>10} {size / scalar:>15,.0f} {size / kernel:>15,.0f} "
+            f"{size / (kernel + logs):>18,.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Load test of group-commit package registration.
+
+Registers packages straight through the repository with many concurrent
+callers, first one transaction per package, then through
+RegistrationBatcher with different windows. Needs the MySQL database
+from the settings. Run with ``python -m app.benchmarks.group_commit``.
+"""
+import argparse
+import asyncio
+from datetime import datetime
+from time import perf_counter
+from uuid import uuid4
+
+import numpy as np
+
+from app.core.settings import settings
+from app.infrastructure.models import engine, get_sessionmaker
+from app.infrastructure.mysql_repository import DeltaMySQLRepository
+from app.schemas import PackageCreate
+from app.services.use_cases.registration_batcher import RegistrationBatcher
+
+PACKAGE = PackageCreate(
+    name="Benchmark package", weight=1.5, content_value=100.0, type_id=1
+)
+
+
+async def run_load(register, requests: int, concurrency: int) -> list[float]:
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call():
+        async with semaphore:
+            started = perf_counter()
+            await register()
+            latencies.append(perf_counter() - started)
+
+    await asyncio.gather(*(call() for _ in range(requests)))
+    return latencies
+
+
+def report(mode: str, latencies: list[float], elapsed: float) -> None:
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    print(
+        f"{mode:>14} {len(latencies) / elapsed:>10,.0f} {p50:>10.1f} {p99:>10.1f}"
+    )
+
+
+async def main(requests: int, concurrency: int, windows: list[float]) -> None:
+    repository = DeltaMySQLRepository(
+        config=settings.storage_url, sessionmaker=get_sessionmaker()
+    )
+    user_id = str(uuid4())
+    await repository.upsert_users({user_id: datetime.now()})
+
+    print(f"{'mode':>14} {'pkg/s':>10} {'p50 ms':>10} {'p99 ms':>10}")
+    started = perf_counter()
+    latencies = await run_load(
+        lambda: repository.register_package(PACKAGE, user_id), requests, concurrency
+    )
+    report("single", latencies, perf_counter() - started)
+
+    for window in windows:
+        batcher = RegistrationBatcher(
+            repository,
+            settings.copy(update={"register_group_commit_window": window / 1000}),
+        )
+        started = perf_counter()
+        latencies = await run_load(
+            lambda: batcher.register(PACKAGE, user_id), requests, concurrency
+        )
+        report(f"window {window:g} ms", latencies, perf_counter() - started)
+        await batcher.close()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument(
+        "--windows", type=float, nargs="+", default=[1, 2, 5, 10, 20]
+    )
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency, args.windows))
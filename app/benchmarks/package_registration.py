@@ -0,0 +1,67 @@
+"""
+Throughput of single versus batch package registration.
+
+Start the API and run with
+``python -m app.benchmarks.package_registration --url http://localhost:8080``.
+"""
+import argparse
+import asyncio
+from time import perf_counter
+
+import httpx
+
+PACKAGE = {"name": "Benchmark package", "weight": 1.5, "content_value": 100.0}
+
+
+def make_packages(count: int) -> list[dict]:
+    return [{**PACKAGE, "type_id": number % 3 + 1} for number in range(count)]
+
+
+async def register_single(client: httpx.AsyncClient, packages: list[dict]) -> None:
+    for package in packages:
+        response = await client.post("/packages/register", json=package)
+        response.raise_for_status()
+
+
+async def register_batch(
+    client: httpx.AsyncClient, packages: list[dict], batch_size: int
+) -> None:
+    for start in range(0, len(packages), batch_size):
+        response = await client.post(
+            "/packages/register_batch", json=packages[start : start + batch_size]
+        )
+        response.raise_for_status()
+
+
+async def measure(coroutine) -> float:
+    started = perf_counter()
+    await coroutine
+    return perf_counter() - started
+
+
+async def main(url: str, count: int, batch_sizes: list[int]) -> None:
+    async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+        response = await client.get("/start_session")
+        client.cookies.set("session_id", response.json()["session_id"])
+        packages = make_packages(count)
+
+        print(f"{'mode':>12} {'packages':>10} {'seconds':>10} {'pkg/s':>12}")
+        elapsed = await measure(register_single(client, packages))
+        print(f"{'single':>12} {count:>10} {elapsed:>10.2f} {count / elapsed:>12,.0f}")
+        for batch_size in batch_sizes:
+            elapsed = await measure(register_batch(client, packages, batch_size))
+            print(
+                f"{f'batch {batch_size}':>12} {count:>10} {elapsed:>10.2f} "
+                f"{count / elapsed:>12,.0f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="http://localhost:8080")
+    parser.add_argument("--count", type=int, default=2000)
+    parser.add_argument(
+        "--batch-sizes", type=int, nargs="+", default=[10, 100, 1000]
+    )
+    args = parser.parse_args()
+    asyncio.run(main(args.url, args.count, args.batch_sizes))
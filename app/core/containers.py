@@ -1,13 +1,22 @@
 from dependency_injector import containers, providers
+from redis.asyncio import Redis
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.settings import settings
+from app.infrastructure.buffered_log_sink import BufferedCalculationLogSink
 from app.infrastructure.models import get_sessionmaker
 from app.infrastructure.mongo_client import MongoClient
 from app.infrastructure.mysql_repository import DeltaMySQLRepository
+from app.infrastructure.redis_client import get_redis_client
+from app.infrastructure.redis_package_queue import RedisPackageQueue
 from app.infrastructure.redis_temporary_storage import RedisTemporaryStorage
+from app.services.use_cases.calculation_jobs import CalculationJobManager
+from app.services.use_cases.package_cache import PackageCache
 from app.services.use_cases.package_cost_calculator import PackageCostCalculator
 from app.services.use_cases.package_service import PackageService
+from app.services.use_cases.rate_provider import RateProvider
+from app.services.use_cases.registration_batcher import RegistrationBatcher
+from app.services.use_cases.session_tracker import SessionTracker
 
 
 class Container(containers.DeclarativeContainer):
@@ -20,11 +29,24 @@ class Container(containers.DeclarativeContainer):
         DeltaMySQLRepository,
         config=config.storage_url,
         sessionmaker=sessionmaker,
+        package_types_ttl=config.package_types_cache_ttl,
+    )
+
+    redis_client: providers.Singleton[Redis] = providers.Singleton(
+        get_redis_client,
+        config=settings,
     )
 
     redis_repository: providers.Provider[RedisTemporaryStorage] = providers.Singleton(
         RedisTemporaryStorage,
         config=settings,
+        redis_client=redis_client,
+    )
+
+    package_queue: providers.Provider[RedisPackageQueue] = providers.Singleton(
+        RedisPackageQueue,
+        config=settings,
+        redis_client=redis_client,
     )
 
     log_repository: providers.Singleton[MongoClient] = providers.Singleton(
@@ -32,14 +54,59 @@ class Container(containers.DeclarativeContainer):
         config=settings,
     )
 
+    log_sink: providers.Singleton[BufferedCalculationLogSink] = providers.Singleton(
+        BufferedCalculationLogSink,
+        log_repository=log_repository,
+        config=settings,
+    )
+
+    rate_provider: providers.Singleton[RateProvider] = providers.Singleton(
+        RateProvider,
+        temp_storage=redis_repository,
+        config=settings,
+    )
+
+    package_cache: providers.Singleton[PackageCache] = providers.Singleton(
+        PackageCache,
+        repository=repository,
+        temp_storage=redis_repository,
+        config=settings,
+    )
+
     cost_calculator: providers.Provider[PackageCostCalculator] = providers.Factory(
         PackageCostCalculator,
         repository=repository,
         temp_storage=redis_repository,
         log_repository=log_repository,
+        log_sink=log_sink,
+        package_queue=package_queue,
+        rate_provider=rate_provider,
+        package_cache=package_cache,
+        config=settings,
+    )
+
+    calculation_jobs: providers.Singleton[CalculationJobManager] = providers.Singleton(
+        CalculationJobManager,
+        calculator_factory=cost_calculator.provider,
+        temp_storage=redis_repository,
         config=settings,
     )
 
+    session_tracker: providers.Singleton[SessionTracker] = providers.Singleton(
+        SessionTracker, repository=repository, config=settings
+    )
+
+    registration_batcher: providers.Provider[RegistrationBatcher] = providers.Singleton(
+        RegistrationBatcher, repository=repository, config=settings
+    )
+
     package_service: providers.Provider[PackageService] = providers.Factory(
-        PackageService, repository=repository
+        PackageService,
+        repository=repository,
+        package_queue=package_queue,
+        temp_storage=redis_repository,
+        session_tracker=session_tracker,
+        registration_batcher=registration_batcher,
+        package_cache=package_cache,
+        config=settings,
     )
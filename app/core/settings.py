@@ -10,10 +10,61 @@ class Settings(BaseSettings):
     mysql_password: str = "password"
     currency_data_source: str = "https://www.cbr-xml-daily.ru/daily_json.js"
     currency_calc_code: str = "USD"
+    rate_fetch_lock_timeout: int = 10
+    rate_fetch_poll_interval: float = 0.1
+    rate_fetch_failure_ttl: int = 30
+    rate_provider_connect_timeout: float = 3.0
+    rate_provider_read_timeout: float = 10.0
+    rate_provider_retries: int = 3
+    rate_provider_backoff: float = 0.5
+    rate_provider_failure_threshold: int = 5
+    rate_provider_circuit_reset_timeout: int = 60
+    rate_max_staleness: int = 4 * 24 * 60 * 60
     redis_host: str = "redis"
     redis_port: int = 6379
+    redis_max_connections: int = 50
     mongo_host: str = "mongodb"
     mongo_port: int = 27017
+    mongo_db: str = "test"
+    calculation_batch_size: int = 1000
+    calculation_interval: int = 60
+    calculation_reconcile_interval: int = 3600
+    calculation_interval_jitter: float = 5.0
+    calculation_lease_range_size: int = 10000
+    calculation_lease_ttl: int = 60
+    calculation_job_ttl: int = 24 * 60 * 60
+    calculation_job_lock_ttl: int = 60
+    calculation_job_heartbeat_interval: float = 5.0
+    calculation_job_start_attempts: int = 50
+    calculation_job_start_poll_interval: float = 0.1
+    aggregated_data_closed_day_ttl: int = 7 * 24 * 60 * 60
+    aggregated_data_current_day_ttl: int = 30
+    my_packages_count_ttl: int = 30
+    package_cache_ttl: int = 300
+    package_cache_tombstone_ttl: int = 5
+    package_cache_load_timeout: float = 2.0
+    register_batch_max_size: int = 1000
+    assign_batch_max_size: int = 1000
+    packages_lookup_max_size: int = 1000
+    register_group_commit: bool = False
+    register_group_commit_window: float = 0.005
+    register_group_commit_max_batch: int = 200
+    package_types_cache_ttl: int = 300
+    known_sessions_cache_size: int = 100000
+    last_access_flush_interval: float = 10.0
+    log_sink_chunk_size: int = 1000
+    log_sink_flush_interval: float = 1.0
+    log_sink_max_buffered: int = 20000
+    log_sink_write_retries: int = 5
+    log_sink_retry_backoff: float = 0.5
+    log_sink_retry_max_backoff: float = 10.0
+    calculation_log_retention_days: int = 90
+    calculation_log_compaction_lead_days: int = 7
+    calculation_log_compaction_interval: int = 24 * 60 * 60
+    package_events_stream: str = "packages:registered"
+    package_events_group: str = "delivery_cost_calculator"
+    package_events_stream_maxlen: int = 1000000
+    package_events_claim_idle_time: int = 60000
 
     @property
     def storage_url(self):
@@ -1,26 +1,133 @@
+import argparse
 import asyncio
+import logging
+import random
+import signal
+from time import monotonic
 
 from core.settings import settings
-from infrastructure.models import get_sessionmaker
+from infrastructure.buffered_log_sink import BufferedCalculationLogSink
+from infrastructure.models import engine, get_sessionmaker
 from infrastructure.mongo_client import MongoClient
 from infrastructure.mysql_repository import DeltaMySQLRepository
+from infrastructure.redis_client import get_redis_client
+from infrastructure.redis_package_queue import RedisPackageQueue
 from infrastructure.redis_temporary_storage import RedisTemporaryStorage
-from services.use_cases.package_cost_calculator import PackageCostCalculator
+from services.use_cases.package_cache import PackageCache
+from services.use_cases.package_cost_calculator import (
+    compact_calculation_logs,
+    PackageCostCalculator,
+)
+from services.use_cases.rate_provider import RateProvider
+
+logger = logging.getLogger(__name__)
 
 sessionmaker = get_sessionmaker()
 my_sql_repository = DeltaMySQLRepository(
     config=settings.storage_url, sessionmaker=sessionmaker
 )
-redis_repository = RedisTemporaryStorage(config=settings)
+redis_client = get_redis_client(settings)
+redis_repository = RedisTemporaryStorage(config=settings, redis_client=redis_client)
 log_repository = MongoClient(config=settings)
+log_sink = BufferedCalculationLogSink(log_repository=log_repository, config=settings)
+package_queue = RedisPackageQueue(config=settings, redis_client=redis_client)
+rate_provider = RateProvider(temp_storage=redis_repository, config=settings)
+package_cache = PackageCache(
+    repository=my_sql_repository, temp_storage=redis_repository, config=settings
+)
 cost_calculator = PackageCostCalculator(
-    my_sql_repository, redis_repository, log_repository, settings
+    my_sql_repository,
+    redis_repository,
+    log_repository,
+    log_sink,
+    package_queue,
+    rate_provider,
+    package_cache,
+    settings,
 )
 
 
+async def shutdown():
+    await log_sink.close()
+    log_repository.close()
+    await rate_provider.close()
+    await redis_client.close()
+    await engine.dispose()
+
+
 async def main():
-    await cost_calculator.calculate_delivery_cost()
+    try:
+        await log_repository.ensure_indexes()
+        await cost_calculator.calculate_delivery_cost()
+    finally:
+        await shutdown()
+
+
+async def run_daemon():
+    stop_event = asyncio.Event()
+
+    def request_stop():
+        logger.info("Shutdown signal received.")
+        stop_event.set()
+        cost_calculator.request_stop()
+
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signal_number, request_stop)
+
+    logger.info(
+        "Delivery cost calculator started with %s s interval.",
+        settings.calculation_interval,
+    )
+    last_reconciliation = None
+    last_compaction = None
+    try:
+        await log_repository.ensure_indexes()
+        while not stop_event.is_set():
+            try:
+                if (
+                    last_reconciliation is None
+                    or monotonic() - last_reconciliation
+                    >= settings.calculation_reconcile_interval
+                ):
+                    await cost_calculator.calculate_delivery_cost()
+                    last_reconciliation = monotonic()
+                else:
+                    await cost_calculator.calculate_new_packages()
+            except Exception:
+                logger.exception("Delivery cost calculation run failed.")
+            if (
+                last_compaction is None
+                or monotonic() - last_compaction
+                >= settings.calculation_log_compaction_interval
+            ):
+                try:
+                    await compact_calculation_logs(log_repository, redis_repository)
+                except Exception:
+                    logger.exception("Calculation log compaction failed.")
+                last_compaction = monotonic()
+            delay = settings.calculation_interval + random.uniform(
+                0, settings.calculation_interval_jitter
+            )
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        await shutdown()
+        logger.info("Delivery cost calculator stopped.")
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Delivery cost calculator")
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help=(
+            "Keep running, calculate newly registered packages every "
+            "CALCULATION_INTERVAL seconds and rescan the whole table every "
+            "CALCULATION_RECONCILE_INTERVAL seconds."
+        ),
+    )
+    args = parser.parse_args()
+    asyncio.run(run_daemon() if args.daemon else main())
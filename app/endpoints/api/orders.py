@@ -1,27 +1,51 @@
 from datetime import datetime
-from typing import Optional
-from uuid import uuid4
+from typing import Any, Optional
+from uuid import UUID, uuid4
 
 from dependency_injector.wiring import inject, Provide
-from fastapi import APIRouter, Cookie, Depends, HTTPException
-from starlette.responses import JSONResponse
+from fastapi import (
+    APIRouter,
+    Body,
+    Cookie,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+)
+from starlette.responses import JSONResponse, Response
 
 from app.core.containers import Container
+from app.infrastructure.buffered_log_sink import BufferedCalculationLogSink
 from app.infrastructure.utils import (
     AlreadyAssignedException,
+    BatchTooLargeException,
+    CalculationJobUnavailableException,
+    InvalidCursorException,
     NotFoundException,
-    UpdateConflictException,
 )
 from app.schemas import (
+    CalculationJobModel,
     CalculationLogAggregatedModel,
+    CalculationLogRangeAggregatedModel,
+    LogSinkMetrics,
     MyPackages,
+    PackageAssignmentRequest,
+    PackageAssignmentResult,
+    PackageBatchResponse,
+    PackageCacheMetrics,
     PackageCreate,
     PackageInfo,
+    PackageLookupRequest,
+    PackageLookupResult,
     PackageResponse,
     PackageTypeModel,
+    RateProviderMetrics,
 )
+from app.services.use_cases.calculation_jobs import CalculationJobManager
+from app.services.use_cases.package_cache import PackageCache
 from app.services.use_cases.package_cost_calculator import PackageCostCalculator
 from app.services.use_cases.package_service import PackageService
+from app.services.use_cases.rate_provider import RateProvider
 
 router = APIRouter()
 
@@ -32,9 +56,11 @@ async def start_session(
         session_id: Optional[str] = Cookie(None),
         package_service: PackageService = Depends(Provide[Container.package_service]),
 ):
-    if not session_id:
+    try:
+        session_id = str(UUID(session_id))
+    except (TypeError, ValueError):
         session_id = str(uuid4())
-        await package_service.save_session(session_id)
+    await package_service.save_session(session_id)
     response = JSONResponse(
         content={"message": "Session started", "session_id": session_id}
     )
@@ -60,17 +86,52 @@ async def register_package(
     return await package_service.register_package(package_data, session_id)
 
 
+@router.post(
+    "/packages/register_batch",
+    response_model=PackageBatchResponse,
+    summary="Register packages in bulk",
+    description=(
+            "Registers up to REGISTER_BATCH_MAX_SIZE packages for the user in one transaction. "
+            "Each item is validated on its own: valid items are registered, invalid ones are "
+            "reported with their errors. Results keep the order of the request."
+    ),
+)
+@inject
+async def register_packages(
+        packages: list[dict[str, Any]] = Body(...),
+        session_id: str = Cookie(...),
+        package_service: PackageService = Depends(Provide[Container.package_service]),
+) -> PackageBatchResponse:
+    try:
+        return await package_service.register_packages(packages, session_id)
+    except BatchTooLargeException as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+
 @router.get(
     "/package-types",
     response_model=list[PackageTypeModel],
     summary="Get all package types",
-    description="Retrieves a list of all available package types from the database.",
+    description=(
+            "Retrieves a list of all available package types. The response carries an ETag, "
+            "send it back in If-None-Match to get 304 Not Modified while the types are unchanged."
+    ),
+    responses={304: {"description": "Package types not modified"}},
 )
 @inject
 async def get_package_types(
+        response: Response,
+        if_none_match: Optional[str] = Header(None),
         package_service: PackageService = Depends(Provide[Container.package_service]),
-) -> list[PackageTypeModel]:
-    return await package_service.get_package_types()
+):
+    package_types, version = await package_service.get_package_types_with_version()
+    etag = f'"{version}"'
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if etag in tags or "*" in tags:
+            return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return package_types
 
 
 @router.get(
@@ -79,7 +140,9 @@ async def get_package_types(
     summary="Get user's packages",
     description=(
             "Retrieves packages associated with the user, with optional filters for type and delivery "
-            "cost calculation status."
+            "cost calculation status. Packages are ordered by id. Pass next_cursor of the previous "
+            "response as `after` to page by cursor instead of offset, and with_total=false to skip "
+            "counting. Totals are cached for a short time."
     ),
 )
 @inject
@@ -87,13 +150,71 @@ async def get_my_packages(
         type_id: Optional[int] = None,
         delivery_cost_calculated: Optional[bool] = None,
         session_id: Optional[str] = Cookie(None),
-        offset: int = 0,
-        limit: int = 10,
+        offset: int = Query(0, ge=0),
+        limit: int = Query(10, ge=1, le=1000),
+        after: Optional[str] = None,
+        with_total: bool = True,
         package_service: PackageService = Depends(Provide[Container.package_service]),
 ) -> MyPackages:
-    return await package_service.get_my_packages(
-        session_id, type_id, delivery_cost_calculated, offset, limit
-    )
+    try:
+        return await package_service.get_my_packages(
+            session_id,
+            type_id,
+            delivery_cost_calculated,
+            offset,
+            limit,
+            after,
+            with_total,
+        )
+    except InvalidCursorException as e:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from e
+
+
+@router.get(
+    "/packages",
+    response_model=list[PackageLookupResult],
+    summary="Get several packages",
+    description=(
+            "Retrieves the user's packages with the given ids in one request, e.g. ?ids=1,2,3 or "
+            "?ids=1&ids=2. Results follow the order of the ids, packages that do not exist or "
+            "belong to another user are returned with found=false."
+    ),
+)
+@inject
+async def get_packages(
+        ids: list[str] = Query(...),
+        session_id: Optional[str] = Cookie(None),
+        package_service: PackageService = Depends(Provide[Container.package_service]),
+) -> list[PackageLookupResult]:
+    try:
+        package_ids = [int(package_id) for value in ids for package_id in value.split(",")]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail="ids must be integers") from e
+    return await lookup_packages(package_service, session_id, package_ids)
+
+
+@router.post(
+    "/packages/lookup",
+    response_model=list[PackageLookupResult],
+    summary="Get several packages by a list of ids",
+    description="Same as GET /packages for id lists too long for a query string.",
+)
+@inject
+async def post_packages_lookup(
+        lookup: PackageLookupRequest,
+        session_id: Optional[str] = Cookie(None),
+        package_service: PackageService = Depends(Provide[Container.package_service]),
+) -> list[PackageLookupResult]:
+    return await lookup_packages(package_service, session_id, lookup.ids)
+
+
+async def lookup_packages(
+        package_service: PackageService, session_id: Optional[str], package_ids: list[int]
+) -> list[PackageLookupResult]:
+    try:
+        return await package_service.get_packages(session_id, package_ids)
+    except BatchTooLargeException as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
 
 
 @router.get(
@@ -116,17 +237,83 @@ async def get_package(
 
 @router.post(
     "/run_calculation",
+    response_model=CalculationJobModel,
+    status_code=202,
     summary="Run delivery cost calculation",
-    description="Triggers the delivery cost calculation process for all packages.",
+    description=(
+            "Queues the delivery cost calculation for all packages and returns the job. "
+            "Only one calculation job runs at a time, so if one is already active it is "
+            "returned instead. Responds with 503 while another job is still starting."
+    ),
 )
 @inject
 async def run_calculation(
-        cost_calculator: PackageCostCalculator = Depends(
-            Provide[Container.cost_calculator]
+        calculation_jobs: CalculationJobManager = Depends(
+            Provide[Container.calculation_jobs]
         ),
-):
-    await cost_calculator.calculate_delivery_cost()
-    return {"message": "Calculation is complete."}
+) -> CalculationJobModel:
+    try:
+        return await calculation_jobs.start_job()
+    except CalculationJobUnavailableException as e:
+        raise HTTPException(status_code=503, detail=str(e)) from e
+
+
+@router.get(
+    "/calculation_jobs/{job_id}",
+    response_model=CalculationJobModel,
+    summary="Get calculation job status",
+    description="Reports status, processed packages, throughput and errors of a calculation job.",
+)
+@inject
+async def get_calculation_job(
+        job_id: str,
+        calculation_jobs: CalculationJobManager = Depends(
+            Provide[Container.calculation_jobs]
+        ),
+) -> CalculationJobModel:
+    job = await calculation_jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Calculation job not found")
+    return job
+
+
+@router.get(
+    "/rate_provider/metrics",
+    response_model=RateProviderMetrics,
+    summary="Exchange rate provider metrics",
+    description="Returns cache hit/miss counters and fetch latency of the exchange rate provider.",
+)
+@inject
+async def rate_provider_metrics(
+        rate_provider: RateProvider = Depends(Provide[Container.rate_provider]),
+) -> RateProviderMetrics:
+    return rate_provider.get_metrics()
+
+
+@router.get(
+    "/package_cache/metrics",
+    response_model=PackageCacheMetrics,
+    summary="Package cache metrics",
+    description="Returns hit ratio, coalesced misses and lookup latency of the package cache.",
+)
+@inject
+async def package_cache_metrics(
+        package_cache: PackageCache = Depends(Provide[Container.package_cache]),
+) -> PackageCacheMetrics:
+    return package_cache.get_metrics()
+
+
+@router.get(
+    "/log_sink/metrics",
+    response_model=LogSinkMetrics,
+    summary="Calculation log sink metrics",
+    description="Returns write rate and buffer state of the calculation log sink.",
+)
+@inject
+async def log_sink_metrics(
+        log_sink: BufferedCalculationLogSink = Depends(Provide[Container.log_sink]),
+) -> LogSinkMetrics:
+    return log_sink.get_metrics()
 
 
 @router.get(
@@ -138,11 +325,36 @@ async def run_calculation(
 @inject
 async def aggregated_data(
         date: datetime,
+        response: Response,
         cost_calculator: PackageCostCalculator = Depends(
             Provide[Container.cost_calculator]
         ),
 ):
-    return await cost_calculator.get_aggregated_data(date)
+    result, cache_status = await cost_calculator.get_cached_aggregated_data(date)
+    response.headers["X-Cache"] = cache_status
+    return result
+
+
+@router.get(
+    "/aggregated_data/range",
+    response_model=list[CalculationLogRangeAggregatedModel],
+    summary="Retrieve Aggregated Delivery Costs for a Date Range",
+    description=(
+            "Retrieves per-day, per-type sums, counts and averages of delivery costs for "
+            "the dates between from and to inclusive."
+    ),
+)
+@inject
+async def aggregated_data_range(
+        date_from: datetime = Query(..., alias="from"),
+        date_to: datetime = Query(..., alias="to"),
+        cost_calculator: PackageCostCalculator = Depends(
+            Provide[Container.cost_calculator]
+        ),
+):
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="from must not be after to")
+    return await cost_calculator.get_aggregated_data_range(date_from, date_to)
 
 
 @router.post(
@@ -164,8 +376,48 @@ async def assign_package(
         raise HTTPException(status_code=404, detail="Package not found") from e
     except AlreadyAssignedException as e:
         raise HTTPException(status_code=400, detail="Package already assigned") from e
-    except UpdateConflictException as e:
-        raise HTTPException(
-            status_code=409,
-            detail="Conflict: Package was assigned by another transaction",
-        ) from e
+
+
+@router.post(
+    "/companies/{company_id}/claim",
+    response_model=list[PackageInfo],
+    summary="Claim the next packages for a Transport Company",
+    description=(
+            "Assigns up to `limit` free packages with a calculated delivery cost to the company and "
+            "returns them. Rows locked by concurrent claims are skipped, so companies never wait "
+            "for or collide with each other. An empty list means there is nothing to claim."
+    ),
+)
+@inject
+async def claim_packages(
+        company_id: int,
+        limit: int = Query(10, ge=1),
+        package_service: PackageService = Depends(Provide[Container.package_service]),
+) -> list[PackageInfo]:
+    try:
+        return await package_service.claim_packages(company_id, limit)
+    except BatchTooLargeException as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+
+@router.post(
+    "/assign_packages",
+    response_model=list[PackageAssignmentResult],
+    summary="Assign packages to a Transport Company in bulk",
+    description=(
+            "Assigns every free package from the list to the company. Each id gets its own outcome: "
+            "assigned, already_assigned or not_found. Duplicate ids are reported once, in the order "
+            "of the request."
+    ),
+)
+@inject
+async def assign_packages(
+        assignment: PackageAssignmentRequest,
+        package_service: PackageService = Depends(Provide[Container.package_service]),
+) -> list[PackageAssignmentResult]:
+    try:
+        return await package_service.assign_packages(
+            assignment.package_ids, assignment.company_id
+        )
+    except BatchTooLargeException as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
@@ -0,0 +1,185 @@
+import asyncio
+import logging
+from time import monotonic
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from app.core.settings import Settings
+from app.infrastructure.utils import CalculationLogStorageUnavailableException
+from app.schemas import CalculationLogModel, LogSinkMetrics
+from app.services.use_cases.abstract_repositories import (
+    AbstractCalculationLogRepository,
+    AbstractCalculationLogSink,
+)
+from app.services.use_cases.delivery_cost_kernel import aggregate_calculation_logs
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("package_service")
+
+T = TypeVar("T")
+
+
+class BufferedCalculationLogSink(AbstractCalculationLogSink):
+    def __init__(
+        self, log_repository: AbstractCalculationLogRepository, config: Settings
+    ):
+        self.log_repository = log_repository
+        self.config = config
+        self.buffer: list[CalculationLogModel] = []
+        self.changed = asyncio.Condition()
+        self.flusher: Optional[asyncio.Task] = None
+        self.in_flight = 0
+        self.flush_waiters = 0
+        self.closed = False
+        self.metrics = LogSinkMetrics()
+
+    async def add_calc_data(self, calc_log_models: list[CalculationLogModel]) -> None:
+        self.ensure_flusher()
+        chunk_size = self.config.log_sink_chunk_size
+        async with self.changed:
+            for start in range(0, len(calc_log_models), chunk_size):
+                await self.changed.wait_for(
+                    lambda: len(self.buffer) < self.config.log_sink_max_buffered
+                )
+                self.buffer.extend(calc_log_models[start : start + chunk_size])
+                self.changed.notify_all()
+
+    async def flush(self) -> None:
+        if self.flusher is None:
+            return
+        async with self.changed:
+            self.flush_waiters += 1
+            self.changed.notify_all()
+            try:
+                await self.changed.wait_for(
+                    lambda: not self.buffer and not self.in_flight
+                )
+            finally:
+                self.flush_waiters -= 1
+
+    async def close(self) -> None:
+        await self.flush()
+        if self.flusher is None:
+            return
+        async with self.changed:
+            self.closed = True
+            self.changed.notify_all()
+        await self.flusher
+        self.flusher = None
+        metrics = self.get_metrics()
+        logger.info(
+            "Calculation log sink closed: %s docs written at %.0f docs/sec.",
+            metrics.docs_written,
+            metrics.docs_per_second,
+        )
+
+    def ensure_flusher(self) -> None:
+        if self.flusher is None:
+            self.closed = False
+            self.flusher = asyncio.create_task(self.run_flusher())
+
+    def ready_to_write(self) -> bool:
+        return (
+            len(self.buffer) >= self.config.log_sink_chunk_size
+            or (self.buffer and self.flush_waiters > 0)
+            or self.closed
+        )
+
+    async def run_flusher(self) -> None:
+        while True:
+            async with self.changed:
+                try:
+                    await asyncio.wait_for(
+                        self.changed.wait_for(self.ready_to_write),
+                        timeout=self.config.log_sink_flush_interval,
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                if not self.buffer:
+                    if self.closed:
+                        return
+                    continue
+                # The chunk stays buffered while its write is retried, so
+                # producers block while Mongo is down. It is dropped only when
+                # the retries run out or the write failed in a way that could
+                # have been applied.
+                chunk = self.buffer[: self.config.log_sink_chunk_size]
+                self.in_flight += 1
+            written = False
+            try:
+                await self.write_chunk(chunk)
+                written = True
+            finally:
+                async with self.changed:
+                    if written:
+                        del self.buffer[: len(chunk)]
+                    self.in_flight -= 1
+                    self.changed.notify_all()
+
+    async def write_chunk(self, chunk: list[CalculationLogModel]) -> None:
+        # Daily totals are derived from the logs that were actually written, so
+        # they never drift from the raw logs they are rebuilt from.
+        started = monotonic()
+        written = await self.write_with_retries(
+            lambda: self.log_repository.add_calc_data(chunk), "Calculation logs"
+        )
+        inserted = len(written) if written else 0
+        if written:
+            daily_totals = aggregate_calculation_logs(written)
+            if (
+                await self.write_with_retries(
+                    lambda: self.log_repository.add_daily_totals(daily_totals),
+                    "Daily delivery totals",
+                )
+                is None
+            ):
+                self.metrics.daily_totals_failed += len(daily_totals)
+        elapsed = monotonic() - started
+        self.metrics.docs_written += inserted
+        self.metrics.docs_failed += len(chunk) - inserted
+        self.metrics.chunks_written += 1
+        self.metrics.write_seconds += elapsed
+        logger.info(
+            "Calculation logs written: %s docs in %.3f s (%.0f docs/sec).",
+            inserted,
+            elapsed,
+            inserted / elapsed if elapsed > 0 else 0.0,
+        )
+
+    async def write_with_retries(
+        self, write: Callable[[], Awaitable[T]], description: str
+    ) -> Optional[T]:
+        retries = self.config.log_sink_write_retries
+        for attempt in range(retries + 1):
+            try:
+                return await write()
+            except CalculationLogStorageUnavailableException as e:
+                if attempt == retries:
+                    logger.error(
+                        f"{description} dropped after {attempt + 1} attempts: {e}"
+                    )
+                    return None
+                backoff = min(
+                    self.config.log_sink_retry_backoff * 2**attempt,
+                    self.config.log_sink_retry_max_backoff,
+                )
+                self.metrics.write_retries += 1
+                logger.warning(
+                    f"Error while writing {description.lower()}: {e}. "
+                    f"Retrying in {backoff:.2f} s."
+                )
+                await asyncio.sleep(backoff)
+            except Exception as e:
+                # The write may have been applied before the error. Logs have no
+                # unique key and totals are increments, so a retry could count
+                # them twice.
+                logger.error(
+                    f"{description} may not have been written, not retrying: {e}"
+                )
+                return None
+
+    def get_metrics(self) -> LogSinkMetrics:
+        metrics = self.metrics.copy()
+        metrics.buffered = len(self.buffer)
+        if metrics.write_seconds > 0:
+            metrics.docs_per_second = metrics.docs_written / metrics.write_seconds
+        return metrics
@@ -1,11 +1,14 @@
 from sqlalchemy import (
     BigInteger,
+    Boolean,
     CHAR,
     Column,
+    Computed,
     DateTime,
     Float,
     ForeignKey,
     func,
+    Index,
     Integer,
     String,
 )
@@ -15,7 +18,7 @@ from sqlalchemy.orm import relationship
 
 from app.core.settings import settings
 
-engine = create_async_engine(settings.storage_url, echo=False)
+engine = create_async_engine(settings.storage_url, echo=False, pool_pre_ping=True)
 Base = declarative_base()
 metadata = Base.metadata
 
@@ -45,10 +48,31 @@ class Package(Base):
     user_id = Column(CHAR(36), ForeignKey("users.id"), nullable=False)
     company_id = Column(Integer, index=True, nullable=True)
     version = Column(BigInteger, nullable=False, default=0)
+    needs_calculation = Column(
+        Boolean, Computed("delivery_cost IS NULL", persisted=False)
+    )
 
     user = relationship("User", back_populates="packages")
     type = relationship("PackageType", back_populates="packages")
 
+    __table_args__ = (
+        Index("ix_packages_needs_calculation_id", "needs_calculation", "id"),
+        Index("ix_packages_user_id_id", "user_id", "id"),
+        Index("ix_packages_user_id_type_id_id", "user_id", "type_id", "id"),
+        Index(
+            "ix_packages_user_id_needs_calculation_id",
+            "user_id",
+            "needs_calculation",
+            "id",
+        ),
+        Index(
+            "ix_packages_company_id_needs_calculation_id",
+            "company_id",
+            "needs_calculation",
+            "id",
+        ),
+    )
+
 
 class PackageType(Base):
     __tablename__ = "package_types"
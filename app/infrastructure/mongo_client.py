@@ -1,50 +1,194 @@
 import logging
-from datetime import datetime, timedelta
+from datetime import date, datetime, time, timedelta
+from typing import Optional
 
 from motor.motor_asyncio import AsyncIOMotorClient as Mongo
-from pymongo.errors import BulkWriteError
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, ServerSelectionTimeoutError
 
 from app.core.settings import Settings
-from app.schemas import CalculationLogAggregatedModel, CalculationLogModel
+from app.infrastructure.utils import CalculationLogStorageUnavailableException
+from app.schemas import (
+    CalculationLogAggregatedModel,
+    CalculationLogModel,
+    CalculationLogRangeAggregatedModel,
+    DailyDeliveryTotalModel,
+)
 from app.services.use_cases.abstract_repositories import AbstractCalculationLogRepository
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("package_service")
 
+DELIVERIES = "deliveries"
+DELIVERIES_LEGACY = "deliveries_legacy"
+DELIVERIES_TIMESERIES = {
+    "timeField": "date",
+    "metaField": "package_type_id",
+    "granularity": "minutes",
+}
+
 
 class MongoClient(AbstractCalculationLogRepository):
     def __init__(self, config: Settings):
         self.config = config
         self.mongo = Mongo(config.mongo_host, config.mongo_port)
-        self.database = self.mongo.get_database("test")
-        self.deliveries = self.database.get_collection("deliveries")
+        self.database = self.mongo.get_database(config.mongo_db)
+        self.deliveries = self.database.get_collection(DELIVERIES)
+        self.daily_totals = self.database.get_collection("daily_delivery_totals")
+
+    def close(self) -> None:
+        self.mongo.close()
 
-    async def add_calc_data(self, calc_log_models: list[CalculationLogModel]) -> None:
+    async def add_calc_data(
+        self, calc_log_models: list[CalculationLogModel]
+    ) -> list[CalculationLogModel]:
         try:
             update_result = await self.deliveries.insert_many(
-                [model.dict() for model in calc_log_models]
+                [model.dict() for model in calc_log_models], ordered=False
             )
             if update_result.acknowledged:
                 logger.info("Calculation data added to mongo")
+            return calc_log_models
         except BulkWriteError as e:
             logger.error(f"Error while adding calc data to mongo: {e}")
-            raise
+            failed = {error["index"] for error in e.details["writeErrors"]}
+            return [
+                model
+                for index, model in enumerate(calc_log_models)
+                if index not in failed
+            ]
+        except ServerSelectionTimeoutError as e:
+            # No server was selected, so the insert was never sent.
+            raise CalculationLogStorageUnavailableException(str(e)) from e
+
+    @property
+    def retention_seconds(self) -> int:
+        return self.config.calculation_log_retention_days * 24 * 60 * 60
+
+    async def get_collection_info(self, name: str) -> Optional[dict]:
+        cursor = await self.database.list_collections(filter={"name": name})
+        collections = await cursor.to_list(length=None)
+        return collections[0] if collections else None
+
+    async def ensure_deliveries_collection(self) -> None:
+        info = await self.get_collection_info(DELIVERIES)
+        if info is None:
+            await self.database.create_collection(
+                DELIVERIES,
+                timeseries=DELIVERIES_TIMESERIES,
+                expireAfterSeconds=self.retention_seconds,
+            )
+            logger.info("Time-series collection for calculation logs created")
+        elif info.get("type") == "timeseries":
+            if info["options"].get("expireAfterSeconds") != self.retention_seconds:
+                await self.database.command(
+                    "collMod", DELIVERIES, expireAfterSeconds=self.retention_seconds
+                )
+                logger.info("Calculation log retention updated")
+        else:
+            logger.warning(
+                "Calculation logs are stored in a regular collection without "
+                "retention. Run migrate_calculation_logs.py to convert it."
+            )
+
+    async def ensure_indexes(self) -> None:
+        await self.ensure_deliveries_collection()
+        await self.deliveries.create_index(
+            [
+                ("date", ASCENDING),
+                ("package_type_id", ASCENDING),
+                ("delivery_cost", ASCENDING),
+            ]
+        )
+        await self.daily_totals.create_index(
+            [("date", ASCENDING), ("package_type_id", ASCENDING)], unique=True
+        )
+        logger.info("Mongo indexes are in place")
+
+    async def add_daily_totals(
+        self, daily_totals: list[DailyDeliveryTotalModel]
+    ) -> int:
+        if not daily_totals:
+            return 0
+        try:
+            result = await self.daily_totals.bulk_write(
+                [
+                    UpdateOne(
+                        {"date": total.date, "package_type_id": total.package_type_id},
+                        {
+                            "$inc": {
+                                "delivery_cost_sum": total.delivery_cost_sum,
+                                "count": total.count,
+                            },
+                            "$min": {"delivery_cost_min": total.delivery_cost_min},
+                            "$max": {"delivery_cost_max": total.delivery_cost_max},
+                        },
+                        upsert=True,
+                    )
+                    for total in daily_totals
+                ],
+                ordered=False,
+            )
+        except ServerSelectionTimeoutError as e:
+            # No server was selected, so the update was never sent.
+            raise CalculationLogStorageUnavailableException(str(e)) from e
+        return result.upserted_count + result.modified_count
 
     async def get_aggregated_data(
         self, date: datetime
     ) -> list[CalculationLogAggregatedModel]:
-        index_info = await self.deliveries.index_information()
-        if "package_type_id_1" not in index_info or "date_1" not in index_info:
-            await self.deliveries.create_index("package_type_id")
-            await self.deliveries.create_index("date")
-        formatted_date = date.strftime("%Y-%m-%d")
-        pipeline = [
+        cursor = self.daily_totals.find(
+            {"date": date.strftime("%Y-%m-%d")},
+            {"_id": 0, "package_type_id": 1, "delivery_cost_sum": 1, "date": 1},
+        )
+        results = await cursor.to_list(length=None)
+        return [CalculationLogAggregatedModel(**result) for result in results]
+
+    async def get_aggregated_data_range(
+        self, date_from: datetime, date_to: datetime
+    ) -> list[CalculationLogRangeAggregatedModel]:
+        cursor = self.daily_totals.aggregate(
+            self.get_range_pipeline(date_from, date_to)
+        )
+        results = await cursor.to_list(length=None)
+        return [CalculationLogRangeAggregatedModel(**result) for result in results]
+
+    @staticmethod
+    def get_range_pipeline(date_from: datetime, date_to: datetime) -> list[dict]:
+        return [
+            {
+                "$match": {
+                    "date": {
+                        "$gte": date_from.strftime("%Y-%m-%d"),
+                        "$lte": date_to.strftime("%Y-%m-%d"),
+                    }
+                }
+            },
+            {
+                "$project": {
+                    "_id": 0,
+                    "date": 1,
+                    "package_type_id": 1,
+                    "delivery_cost_sum": 1,
+                    "count": 1,
+                    "delivery_cost_avg": {
+                        "$divide": ["$delivery_cost_sum", "$count"]
+                    },
+                }
+            },
+            {"$sort": {"date": 1, "package_type_id": 1}},
+        ]
+
+    @staticmethod
+    def get_daily_totals_pipeline(
+        first_day: datetime, last_day: datetime
+    ) -> list[dict]:
+        return [
             {
                 "$match": {
                     "date": {
-                        "$gte": datetime.strptime(formatted_date, "%Y-%m-%d"),
-                        "$lt": datetime.strptime(formatted_date, "%Y-%m-%d")
-                        + timedelta(days=1),
+                        "$gte": first_day,
+                        "$lt": last_day + timedelta(days=1),
                     }
                 }
             },
@@ -57,18 +201,112 @@ class MongoClient(AbstractCalculationLogRepository):
                         },
                     },
                     "delivery_cost_sum": {"$sum": "$delivery_cost"},
+                    "count": {"$sum": 1},
+                    "delivery_cost_min": {"$min": "$delivery_cost"},
+                    "delivery_cost_max": {"$max": "$delivery_cost"},
                 }
             },
             {
                 "$project": {
                     "_id": 0,
                     "package_type_id": "$_id.package_type_id",
-                    "delivery_cost_sum": 1,
                     "date": "$_id.date",
+                    "delivery_cost_sum": 1,
+                    "count": 1,
+                    "delivery_cost_min": 1,
+                    "delivery_cost_max": 1,
                 }
             },
         ]
 
-        cursor = self.deliveries.aggregate(pipeline)
-        results = await cursor.to_list(length=None)
-        return [CalculationLogAggregatedModel(**result) for result in results]
+    async def rebuild_daily_totals(self, date_from: datetime, date_to: datetime) -> int:
+        first_day = datetime.strptime(date_from.strftime("%Y-%m-%d"), "%Y-%m-%d")
+        last_day = datetime.strptime(date_to.strftime("%Y-%m-%d"), "%Y-%m-%d")
+        days = [
+            (first_day + timedelta(days=offset)).strftime("%Y-%m-%d")
+            for offset in range((last_day - first_day).days + 1)
+        ]
+        await self.daily_totals.delete_many({"date": {"$in": days}})
+        pipeline = self.get_daily_totals_pipeline(first_day, last_day) + [
+            {
+                "$merge": {
+                    "into": "daily_delivery_totals",
+                    "on": ["date", "package_type_id"],
+                    "whenMatched": "replace",
+                    "whenNotMatched": "insert",
+                }
+            },
+        ]
+        await self.deliveries.aggregate(pipeline).to_list(length=None)
+        rebuilt = await self.daily_totals.count_documents({"date": {"$in": days}})
+        logger.info(f"Rebuilt {rebuilt} daily totals for {days[0]}..{days[-1]}.")
+        return rebuilt
+
+    def get_compaction_window(self) -> Optional[tuple[datetime, datetime]]:
+        # Re-aggregate the oldest days before their raw logs expire. The window
+        # starts a day after the expiry cutoff, so no day is rebuilt from
+        # partially expired buckets.
+        today = datetime.combine(date.today(), time())
+        first_day = today - timedelta(
+            days=self.config.calculation_log_retention_days - 1
+        )
+        last_day = min(
+            first_day
+            + timedelta(days=self.config.calculation_log_compaction_lead_days - 1),
+            today - timedelta(days=1),
+        )
+        if last_day < first_day:
+            return None
+        return first_day, last_day
+
+    async def migrate_deliveries_to_timeseries(self, drop_legacy: bool = False) -> int:
+        # Daily totals are rebuilt from the whole legacy collection first, so
+        # days outside the retention window survive as summaries only.
+        info = await self.get_collection_info(DELIVERIES)
+        if info is not None and info.get("type") == "timeseries":
+            logger.info("Calculation logs are already in a time-series collection")
+            return 0
+        if await self.get_collection_info(DELIVERIES_LEGACY) is not None:
+            raise RuntimeError(
+                f"Collection {DELIVERIES_LEGACY} already exists. "
+                "Finish or clean up the previous migration first."
+            )
+
+        migrated = 0
+        if info is not None:
+            bounds = await self.deliveries.aggregate(
+                [
+                    {
+                        "$group": {
+                            "_id": None,
+                            "first": {"$min": "$date"},
+                            "last": {"$max": "$date"},
+                        }
+                    }
+                ]
+            ).to_list(length=None)
+            if bounds:
+                await self.rebuild_daily_totals(bounds[0]["first"], bounds[0]["last"])
+            await self.deliveries.rename(DELIVERIES_LEGACY)
+
+        await self.ensure_indexes()
+
+        if info is not None:
+            legacy = self.database.get_collection(DELIVERIES_LEGACY)
+            cutoff = datetime.now() - timedelta(seconds=self.retention_seconds)
+            chunk = []
+            async for document in legacy.find(
+                {"date": {"$gte": cutoff}}, {"_id": 0}
+            ).sort("date", ASCENDING):
+                chunk.append(document)
+                if len(chunk) >= self.config.log_sink_chunk_size:
+                    await self.deliveries.insert_many(chunk, ordered=False)
+                    migrated += len(chunk)
+                    chunk = []
+            if chunk:
+                await self.deliveries.insert_many(chunk, ordered=False)
+                migrated += len(chunk)
+            if drop_legacy:
+                await legacy.drop()
+        logger.info(f"Migrated {migrated} calculation logs to time-series collection.")
+        return migrated
@@ -1,8 +1,13 @@
-from typing import Optional
+import asyncio
+import hashlib
+import json
+from datetime import datetime
+from time import monotonic
+from typing import AsyncIterator, Optional
 
-from sqlalchemy import and_, func, select, update
+from sqlalchemy import and_, case, false, func, select, text, true, update
+from sqlalchemy.dialects.mysql import insert
 from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
-from sqlalchemy.orm import joinedload
 
 from app.infrastructure.models import (
     Package,
@@ -12,24 +17,36 @@ from app.infrastructure.models import (
 from app.infrastructure.utils import (
     AlreadyAssignedException,
     NotFoundException,
-    UpdateConflictException,
 )
 from app.schemas import (
-    MyPackages,
+    PackageAssignmentStatus,
+    PackageCacheEntry,
     PackageCreate,
     PackageInfo,
     PackageResponse,
     PackageToCalc,
     PackageTypeModel,
-    UserInfo,
 )
 from app.services.use_cases.abstract_repositories import DeltaAbstractRepository
 
+UPDATE_CHUNK_SIZE = 1000
+
 
 class DeltaMySQLRepository(DeltaAbstractRepository):
-    def __init__(self, *, config: dict, sessionmaker: async_sessionmaker[AsyncSession]):
+    def __init__(
+        self,
+        *,
+        config: dict,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        package_types_ttl: int = 300,
+    ):
         self.config = config
         self.sessionmaker = sessionmaker
+        self.package_types_ttl = package_types_ttl
+        self.package_types: dict[int, PackageTypeModel] = {}
+        self.package_types_version = ""
+        self.package_types_expire_at = 0.0
+        self.package_types_lock = asyncio.Lock()
 
     async def register_package(
         self, package_data: PackageCreate, user_id: str
@@ -50,16 +67,143 @@ class DeltaMySQLRepository(DeltaAbstractRepository):
             await session.commit()
         return package_response
 
-    async def get_package_types(self) -> list[PackageTypeModel]:
+    async def load_package_types(self) -> dict[int, PackageTypeModel]:
+        if monotonic() < self.package_types_expire_at:
+            return self.package_types
+        async with self.package_types_lock:
+            if monotonic() < self.package_types_expire_at:
+                return self.package_types
+            async with self.sessionmaker() as session:
+                package_types_result = await session.execute(
+                    select(PackageType).order_by(PackageType.name)
+                )
+                package_types_list = [
+                    PackageTypeModel.from_orm(package_type)
+                    for package_type in package_types_result.scalars()
+                ]
+            self.package_types = {
+                package_type.id: package_type for package_type in package_types_list
+            }
+            self.package_types_version = hashlib.sha1(
+                json.dumps(
+                    [package_type.dict() for package_type in package_types_list]
+                ).encode("utf-8")
+            ).hexdigest()
+            self.package_types_expire_at = monotonic() + self.package_types_ttl
+            return self.package_types
+
+    def invalidate_package_types(self) -> None:
+        self.package_types_expire_at = 0.0
+
+    async def get_package_type(self, type_id: int) -> PackageTypeModel:
+        package_types = await self.load_package_types()
+        if type_id not in package_types:
+            self.invalidate_package_types()
+            package_types = await self.load_package_types()
+        return package_types[type_id]
+
+    async def get_package_types_with_version(
+        self,
+    ) -> tuple[list[PackageTypeModel], str]:
+        package_types = await self.load_package_types()
+        return list(package_types.values()), self.package_types_version
+
+    async def register_packages(
+        self, packages: list[PackageCreate], user_id: str
+    ) -> list[int]:
+        return await self.register_packages_for_users(
+            [(package, user_id) for package in packages]
+        )
+
+    async def register_packages_for_users(
+        self, registrations: list[tuple[PackageCreate, str]]
+    ) -> list[int]:
+        package_ids = []
         async with self.sessionmaker() as session:
             async with session.begin():
-                package_types = await session.execute(select(PackageType))
-                package_types_list = package_types.scalars().all()
+                increment = await session.scalar(
+                    text("SELECT @@SESSION.auto_increment_increment")
+                )
+                for start in range(0, len(registrations), UPDATE_CHUNK_SIZE):
+                    rows = [
+                        {
+                            "name": package.name,
+                            "weight": package.weight,
+                            "content_value": package.content_value,
+                            "type_id": package.type_id,
+                            "user_id": user_id,
+                        }
+                        for package, user_id in registrations[
+                            start : start + UPDATE_CHUNK_SIZE
+                        ]
+                    ]
+                    package_ids.extend(
+                        await self.insert_packages(session, rows, increment)
+                    )
+        return package_ids
 
-                return [
-                    PackageTypeModel.from_orm(package_type)
-                    for package_type in package_types_list
-                ]
+    async def insert_packages(
+        self, session: AsyncSession, rows: list[dict], increment: int
+    ) -> list[int]:
+        # A multi-row insert reports only its first id. The others usually
+        # follow it in steps of auto_increment_increment, but InnoDB does not
+        # promise that, so the guess is checked and the rows are inserted one
+        # by one when it is wrong.
+        async with session.begin_nested() as savepoint:
+            result = await session.execute(insert(Package).values(rows))
+            package_ids = list(
+                range(
+                    result.lastrowid,
+                    result.lastrowid + len(rows) * increment,
+                    increment,
+                )
+            )
+            if await self.inserted_rows_match(session, package_ids, rows):
+                return package_ids
+            await savepoint.rollback()
+        package_ids = []
+        for row in rows:
+            result = await session.execute(insert(Package).values(row))
+            package_ids.append(result.lastrowid)
+        return package_ids
+
+    @staticmethod
+    async def inserted_rows_match(
+        session: AsyncSession, package_ids: list[int], rows: list[dict]
+    ) -> bool:
+        inserted_result = await session.execute(
+            select(Package.id, Package.user_id, Package.name, Package.type_id).where(
+                Package.id.in_(package_ids)
+            )
+        )
+        inserted = {
+            package_id: (user_id, name, type_id)
+            for package_id, user_id, name, type_id in inserted_result
+        }
+        return all(
+            inserted.get(package_id) == (row["user_id"], row["name"], row["type_id"])
+            for package_id, row in zip(package_ids, rows)
+        )
+
+    async def get_package_types(self) -> list[PackageTypeModel]:
+        package_types, _ = await self.get_package_types_with_version()
+        return package_types
+
+    @staticmethod
+    def get_my_packages_conditions(
+        user_id: str,
+        type_id: Optional[int],
+        delivery_cost_calculated: Optional[bool],
+    ) -> list:
+        conditions = [Package.user_id == user_id]
+        if type_id is not None:
+            conditions.append(Package.type_id == type_id)
+        if delivery_cost_calculated is not None:
+            if delivery_cost_calculated:
+                conditions.append(Package.needs_calculation == false())
+            else:
+                conditions.append(Package.needs_calculation == true())
+        return conditions
 
     async def get_my_packages(
         self,
@@ -68,51 +212,53 @@ class DeltaMySQLRepository(DeltaAbstractRepository):
         delivery_cost_calculated: Optional[bool],
         offset: int,
         limit: int,
-    ) -> MyPackages:
+        after_id: Optional[int] = None,
+    ) -> list[PackageInfo]:
         async with self.sessionmaker() as session:
-            conditions = [Package.user_id == user_id]
-            if type_id is not None:
-                conditions.append(Package.type_id == type_id)
-            if delivery_cost_calculated is not None:
-                if delivery_cost_calculated:
-                    conditions.append(Package.delivery_cost.isnot(None))
-                else:
-                    conditions.append(Package.delivery_cost.is_(None))
-
+            conditions = self.get_my_packages_conditions(
+                user_id, type_id, delivery_cost_calculated
+            )
             packages_query = (
                 select(Package)
-                .options(joinedload(Package.type))
-                .where(and_(*conditions))
-                .offset(offset)
+                .order_by(Package.id)
                 .limit(limit)
             )
-            packages_result = await session.execute(packages_query)
-            packages = packages_result.scalars().all()
-
-            total_count_query = (
-                select(func.count()).select_from(Package).where(and_(*conditions))
+            if after_id is not None:
+                conditions.append(Package.id > after_id)
+            else:
+                packages_query = packages_query.offset(offset)
+            packages_result = await session.execute(
+                packages_query.where(and_(*conditions))
             )
-            total_count_result = await session.execute(total_count_query)
-            total_items = total_count_result.scalar_one()
+            packages = packages_result.scalars().all()
 
-            package_infos = [
+            return [
                 PackageInfo(
                     id=package.id,
                     name=package.name,
                     weight=package.weight,
                     delivery_cost=package.delivery_cost,
                     content_value=package.content_value,
-                    package_type=PackageTypeModel.from_orm(package.type),
+                    package_type=await self.get_package_type(package.type_id),
                 )
                 for package in packages
             ]
 
-            return MyPackages(
-                page=offset // limit + 1,
-                page_size=limit,
-                total_items=total_items,
-                data=package_infos,
+    async def count_my_packages(
+        self,
+        user_id: str,
+        type_id: Optional[int],
+        delivery_cost_calculated: Optional[bool],
+    ) -> int:
+        async with self.sessionmaker() as session:
+            conditions = self.get_my_packages_conditions(
+                user_id, type_id, delivery_cost_calculated
             )
+            total_count_query = (
+                select(func.count()).select_from(Package).where(and_(*conditions))
+            )
+            total_count_result = await session.execute(total_count_query)
+            return total_count_result.scalar_one()
 
     async def get_package(self, user_id: str, package_id: int) -> Optional[PackageInfo]:
         async with self.sessionmaker() as session:
@@ -124,40 +270,128 @@ class DeltaMySQLRepository(DeltaAbstractRepository):
             if not package:
                 return None
 
-            package_type_query = select(PackageType).where(
-                PackageType.id == package.type_id
-            )
-            package_type_result = await session.execute(package_type_query)
-            package_type = package_type_result.scalar()
-
             return PackageInfo(
                 id=package.id,
                 name=package.name,
                 weight=package.weight,
                 content_value=package.content_value,
                 delivery_cost=package.delivery_cost,
-                package_type=PackageTypeModel.from_orm(package_type),
+                package_type=await self.get_package_type(package.type_id),
+            )
+
+    async def get_package_entry(self, package_id: int) -> Optional[PackageCacheEntry]:
+        async with self.sessionmaker() as session:
+            package_result = await session.execute(
+                select(Package).where(Package.id == package_id)
+            )
+            package = package_result.scalar()
+
+            if not package:
+                return None
+
+            return PackageCacheEntry(
+                user_id=package.user_id,
+                version=package.version,
+                package=PackageInfo(
+                    id=package.id,
+                    name=package.name,
+                    weight=package.weight,
+                    content_value=package.content_value,
+                    delivery_cost=package.delivery_cost,
+                    package_type=await self.get_package_type(package.type_id),
+                ),
             )
 
-    async def get_or_create_user(self, user_id: str) -> UserInfo:
+    async def get_packages(
+        self, user_id: str, package_ids: list[int]
+    ) -> dict[int, PackageInfo]:
+        async with self.sessionmaker() as session:
+            packages_result = await session.execute(
+                select(Package).where(
+                    Package.user_id == user_id, Package.id.in_(package_ids)
+                )
+            )
+            packages = packages_result.scalars().all()
+
+            return {
+                package.id: PackageInfo(
+                    id=package.id,
+                    name=package.name,
+                    weight=package.weight,
+                    content_value=package.content_value,
+                    delivery_cost=package.delivery_cost,
+                    package_type=await self.get_package_type(package.type_id),
+                )
+                for package in packages
+            }
+
+    async def upsert_users(self, last_access: dict[str, datetime]) -> None:
+        users = list(last_access.items())
         async with self.sessionmaker() as session:
-            user_query = select(User).where(User.id == user_id)
-            user_result = await session.execute(user_query)
-            user = user_result.scalar()
+            async with session.begin():
+                for start in range(0, len(users), UPDATE_CHUNK_SIZE):
+                    chunk = users[start : start + UPDATE_CHUNK_SIZE]
+                    upsert_query = insert(User).values(
+                        [
+                            {"id": user_id, "last_access_time": last_access_time}
+                            for user_id, last_access_time in chunk
+                        ]
+                    )
+                    accessed_at = upsert_query.inserted.last_access_time
+                    await session.execute(
+                        upsert_query.on_duplicate_key_update(
+                            last_access_time=func.greatest(
+                                func.coalesce(User.last_access_time, accessed_at),
+                                accessed_at,
+                            )
+                        )
+                    )
 
-            if not user:
-                user = User(id=user_id)
-                session.add(user)
-                await session.commit()
-                await session.refresh(user)
+    async def get_pending_id_bounds(self) -> Optional[tuple[int, int]]:
+        async with self.sessionmaker() as session:
+            bounds_query = select(func.min(Package.id), func.max(Package.id)).where(
+                Package.needs_calculation == true()
+            )
+            bounds_result = await session.execute(bounds_query)
+            min_id, max_id = bounds_result.one()
+            if min_id is None:
+                return None
+            return min_id, max_id
+
+    async def get_packages_to_calc(
+        self, after_id: int, limit: int, max_id: Optional[int] = None
+    ) -> list[PackageToCalc]:
+        conditions = [Package.needs_calculation == true(), Package.id > after_id]
+        if max_id is not None:
+            conditions.append(Package.id <= max_id)
+        return await self._select_packages_to_calc(conditions, limit)
 
-            return UserInfo.from_orm(user)
+    async def get_packages_to_calc_by_ids(
+        self, package_ids: list[int]
+    ) -> list[PackageToCalc]:
+        conditions = [
+            Package.needs_calculation == true(),
+            Package.id.in_(package_ids),
+        ]
+        return await self._select_packages_to_calc(conditions, len(package_ids))
 
-    async def get_packages_to_calc(self) -> list[PackageToCalc]:
+    async def _select_packages_to_calc(
+        self, conditions: list, limit: int
+    ) -> list[PackageToCalc]:
         async with self.sessionmaker() as session:
-            packages_query = select(Package).where(Package.delivery_cost.is_(None))
+            packages_query = (
+                select(
+                    Package.id,
+                    Package.type_id,
+                    Package.name,
+                    Package.weight,
+                    Package.content_value,
+                )
+                .where(and_(*conditions))
+                .order_by(Package.id)
+                .limit(limit)
+            )
             packages_result = await session.execute(packages_query)
-            packages = packages_result.scalars().all()
 
             return [
                 PackageToCalc(
@@ -165,46 +399,124 @@ class DeltaMySQLRepository(DeltaAbstractRepository):
                     package_type_id=package.type_id,
                     name=package.name,
                     weight=package.weight,
-                    delivery_cost=package.delivery_cost,
+                    delivery_cost=None,
                     content_value=package.content_value,
                 )
-                for package in packages
+                for package in packages_result
             ]
 
+    async def iter_packages_to_calc(
+        self, batch_size: int, after_id: int = 0, max_id: Optional[int] = None
+    ) -> AsyncIterator[list[PackageToCalc]]:
+        last_id = after_id
+        while True:
+            batch = await self.get_packages_to_calc(last_id, batch_size, max_id)
+            if not batch:
+                return
+            yield batch
+            if len(batch) < batch_size:
+                return
+            last_id = batch[-1].id
+
     async def update_delivery_costs(
         self, packages_to_update: list[PackageToCalc]
-    ) -> None:
+    ) -> int:
+        updated_rows = 0
         async with self.sessionmaker() as session:
             async with session.begin():
-                for package_calc in packages_to_update:
-                    query = select(Package).where(Package.id == package_calc.id)
-                    result = await session.execute(query)
-                    if package := result.scalar_one_or_none():
-                        package.delivery_cost = package_calc.delivery_cost
-                await session.commit()
+                for start in range(0, len(packages_to_update), UPDATE_CHUNK_SIZE):
+                    chunk = packages_to_update[start : start + UPDATE_CHUNK_SIZE]
+                    costs = {package.id: package.delivery_cost for package in chunk}
+                    result = await session.execute(
+                        update(Package)
+                        .where(Package.id.in_(costs))
+                        .values(
+                            delivery_cost=case(costs, value=Package.id),
+                            version=Package.version + 1,
+                        )
+                        .execution_options(synchronize_session=False)
+                    )
+                    updated_rows += result.rowcount
+        return updated_rows
 
     async def assign_package(self, package_id: int, company_id: int) -> None:
         async with self.sessionmaker() as session:
-            result = await session.execute(
-                select(Package).filter(Package.id == package_id)
-            )
-            package = result.scalar_one_or_none()
-
-            if package is None:
-                raise NotFoundException("Package not found")
-
-            if package.company_id:
+            async with session.begin():
+                result = await session.execute(
+                    update(Package)
+                    .where(Package.id == package_id, Package.company_id.is_(None))
+                    .values(company_id=company_id, version=Package.version + 1)
+                    .execution_options(synchronize_session=False)
+                )
+                if result.rowcount == 1:
+                    return
+                # Only a failed assignment pays for the read telling why.
+                package_result = await session.execute(
+                    select(Package.id).where(Package.id == package_id)
+                )
+                if package_result.scalar() is None:
+                    raise NotFoundException("Package not found")
                 raise AlreadyAssignedException("Package already assigned")
 
-            updated_rows = await session.execute(
-                update(Package)
-                .where(Package.id == package_id, Package.version == package.version)
-                .values(company_id=company_id, version=Package.version + 1)
+    async def claim_packages(self, company_id: int, limit: int) -> list[PackageInfo]:
+        async with self.sessionmaker() as session:
+            async with session.begin():
+                packages_result = await session.execute(
+                    select(Package)
+                    .where(
+                        Package.company_id.is_(None),
+                        Package.needs_calculation == false(),
+                    )
+                    .order_by(Package.id)
+                    .limit(limit)
+                    .with_for_update(skip_locked=True)
+                )
+                packages = packages_result.scalars().all()
+                if packages:
+                    await session.execute(
+                        update(Package)
+                        .where(Package.id.in_([package.id for package in packages]))
+                        .values(company_id=company_id, version=Package.version + 1)
+                        .execution_options(synchronize_session=False)
+                    )
+        return [
+            PackageInfo(
+                id=package.id,
+                name=package.name,
+                weight=package.weight,
+                delivery_cost=package.delivery_cost,
+                content_value=package.content_value,
+                package_type=await self.get_package_type(package.type_id),
             )
+            for package in packages
+        ]
 
-            if updated_rows.rowcount == 0:
-                raise UpdateConflictException(
-                    "Conflict: Package was assigned by another transaction"
+    async def assign_packages(
+        self, package_ids: list[int], company_id: int
+    ) -> dict[int, PackageAssignmentStatus]:
+        async with self.sessionmaker() as session:
+            async with session.begin():
+                packages_result = await session.execute(
+                    select(Package.id, Package.company_id)
+                    .where(Package.id.in_(package_ids))
+                    .order_by(Package.id)
+                    .with_for_update()
                 )
-
-            await session.commit()
+                statuses = dict.fromkeys(
+                    package_ids, PackageAssignmentStatus.not_found
+                )
+                assignable = []
+                for package in packages_result:
+                    if package.company_id is None:
+                        statuses[package.id] = PackageAssignmentStatus.assigned
+                        assignable.append(package.id)
+                    else:
+                        statuses[package.id] = PackageAssignmentStatus.already_assigned
+                if assignable:
+                    await session.execute(
+                        update(Package)
+                        .where(Package.id.in_(assignable))
+                        .values(company_id=company_id, version=Package.version + 1)
+                        .execution_options(synchronize_session=False)
+                    )
+        return statuses
@@ -0,0 +1,10 @@
+from redis import asyncio as aioredis
+
+
+def get_redis_client(config) -> aioredis.Redis:
+    return aioredis.Redis(
+        host=config.redis_host,
+        port=config.redis_port,
+        db=0,
+        max_connections=config.redis_max_connections,
+    )
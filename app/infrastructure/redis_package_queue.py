@@ -0,0 +1,71 @@
+from typing import Optional
+
+from redis import asyncio as aioredis
+from redis.exceptions import ResponseError
+
+from app.services.use_cases.abstract_repositories import DeltaAbstractPackageQueue
+
+
+class RedisPackageQueue(DeltaAbstractPackageQueue):
+    def __init__(self, config, redis_client: aioredis.Redis):
+        self.config = config
+        self.redis_client = redis_client
+        self.stream = self.config.package_events_stream
+        self.group = self.config.package_events_group
+        self.group_created = False
+
+    async def publish_package(self, package_id: int) -> None:
+        await self.redis_client.xadd(
+            self.stream,
+            {"package_id": package_id},
+            maxlen=self.config.package_events_stream_maxlen,
+            approximate=True,
+        )
+
+    async def publish_packages(self, package_ids: list[int]) -> None:
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for package_id in package_ids:
+                pipe.xadd(
+                    self.stream,
+                    {"package_id": package_id},
+                    maxlen=self.config.package_events_stream_maxlen,
+                    approximate=True,
+                )
+            await pipe.execute()
+
+    async def read_packages(
+        self, consumer: str, count: int
+    ) -> dict[str, Optional[int]]:
+        await self.ensure_group()
+        _, entries, *_ = await self.redis_client.xautoclaim(
+            self.stream,
+            self.group,
+            consumer,
+            self.config.package_events_claim_idle_time,
+            count=count,
+        )
+        if len(entries) < count:
+            for _, stream_entries in await self.redis_client.xreadgroup(
+                self.group, consumer, {self.stream: ">"}, count=count - len(entries)
+            ):
+                entries.extend(stream_entries)
+        return {
+            entry_id.decode("utf-8"): int(fields[b"package_id"]) if fields else None
+            for entry_id, fields in entries
+        }
+
+    async def ack_packages(self, entry_ids: list[str]) -> None:
+        if entry_ids:
+            await self.redis_client.xack(self.stream, self.group, *entry_ids)
+
+    async def ensure_group(self) -> None:
+        if self.group_created:
+            return
+        try:
+            await self.redis_client.xgroup_create(
+                self.stream, self.group, id="0", mkstream=True
+            )
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self.group_created = True
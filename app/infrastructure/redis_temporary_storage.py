@@ -1,23 +1,99 @@
-import redis
+from typing import Optional
+
+from redis import asyncio as aioredis
 
 from app.services.use_cases.abstract_repositories import DeltaAbstractTemporaryStorage
 
+RENEW_LEASE_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("EXPIRE", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_LEASE_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+# Entries without a version are tombstones left by writers and block every refill.
+SAVE_IF_NEWER_SCRIPT = """
+local current = redis.call("GET", KEYS[1])
+if current then
+    local version = cjson.decode(current).version
+    if version == nil or version >= tonumber(ARGV[2]) then
+        return 0
+    end
+end
+redis.call("SET", KEYS[1], ARGV[1], "EX", ARGV[3])
+return 1
+"""
+
 
 class RedisTemporaryStorage(DeltaAbstractTemporaryStorage):
-    def __init__(self, config):
+    def __init__(self, config, redis_client: aioredis.Redis):
         self.config = config
-        self.redis_client = redis.StrictRedis(
-            host=self.config.redis_host, port=self.config.redis_port, db=0
+        self.redis_client = redis_client
+        self.renew_lease_script = self.redis_client.register_script(RENEW_LEASE_SCRIPT)
+        self.release_lease_script = self.redis_client.register_script(
+            RELEASE_LEASE_SCRIPT
         )
+        self.save_if_newer_script = self.redis_client.register_script(
+            SAVE_IF_NEWER_SCRIPT
+        )
+
+    async def save_key_value(self, key: str, value: str, expiration_time: int) -> None:
+        await self.redis_client.setex(key, expiration_time, value)
 
-    def save_key_value(self, key: str, value: str, expiration_time: int) -> None:
-        self.redis_client.setex(key, expiration_time, value)
+    async def save_key_value_without_exp(self, key: str, value: str) -> None:
+        await self.redis_client.set(key, value, keepttl=True)
 
-    def save_key_value_without_exp(self, key: str, value: str) -> None:
-        self.redis_client.set(key, value, keepttl=True)
+    async def save_many(
+        self, values: dict[str, str], expiration_time: Optional[int] = None
+    ) -> None:
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for key, value in values.items():
+                if expiration_time is None:
+                    pipe.set(key, value, keepttl=True)
+                else:
+                    pipe.set(key, value, ex=expiration_time)
+            await pipe.execute()
+
+    async def save_if_newer(
+        self, key: str, value: str, version: int, expiration_time: int
+    ) -> bool:
+        return bool(
+            await self.save_if_newer_script(
+                keys=[key], args=[value, version, expiration_time]
+            )
+        )
 
-    def get_value(self, key: str) -> None:
-        return self.redis_client.get(key)
+    async def get_value(self, key: str) -> Optional[bytes]:
+        return await self.redis_client.get(key)
+
+    async def get_many(self, keys: list[str]) -> list[Optional[bytes]]:
+        if not keys:
+            return []
+        return await self.redis_client.mget(keys)
+
+    async def delete_key(self, key: str) -> None:
+        await self.redis_client.delete(key)
+
+    async def delete_keys(self, keys: list[str]) -> None:
+        if keys:
+            await self.redis_client.delete(*keys)
+
+    async def acquire_lease(self, key: str, owner: str, expiration_time: int) -> bool:
+        return bool(
+            await self.redis_client.set(key, owner, nx=True, ex=expiration_time)
+        )
+
+    async def renew_lease(self, key: str, owner: str, expiration_time: int) -> bool:
+        return bool(
+            await self.renew_lease_script(keys=[key], args=[owner, expiration_time])
+        )
 
-    def delete_key(self, key: str) -> None:
-        self.redis_client.delete(key)
+    async def release_lease(self, key: str, owner: str) -> None:
+        await self.release_lease_script(keys=[key], args=[owner])
@@ -6,5 +6,29 @@ class AlreadyAssignedException(Exception):
     pass
 
 
-class UpdateConflictException(Exception):
+class RateProviderUnavailableException(Exception):
+    pass
+
+
+class ExchangeRateUnavailableException(Exception):
+    pass
+
+
+class InvalidCursorException(Exception):
+    pass
+
+
+class BatchTooLargeException(Exception):
+    pass
+
+
+class CalculationJobUnavailableException(Exception):
+    pass
+
+
+class CalculationJobLeaseLostException(Exception):
+    pass
+
+
+class CalculationLogStorageUnavailableException(Exception):
     pass
@@ -17,6 +17,22 @@ def get_application() -> FastAPI:
     application.container = container
     application.include_router(orders.router)
 
+    @application.on_event("startup")
+    async def create_indexes():
+        await container.log_repository().ensure_indexes()
+
+    @application.on_event("startup")
+    async def load_reference_data():
+        await container.repository().load_package_types()
+
+    @application.on_event("shutdown")
+    async def close_clients():
+        await container.calculation_jobs().shutdown()
+        await container.session_tracker().close()
+        await container.registration_batcher().close()
+        await container.log_sink().close()
+        await container.rate_provider().close()
+
     return application
 
 
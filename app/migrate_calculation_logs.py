@@ -0,0 +1,29 @@
+import argparse
+import asyncio
+
+from core.settings import settings
+from infrastructure.mongo_client import MongoClient
+
+
+async def main(drop_legacy: bool):
+    log_repository = MongoClient(config=settings)
+    try:
+        await log_repository.migrate_deliveries_to_timeseries(drop_legacy)
+    finally:
+        log_repository.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=(
+            "Move calculation logs into a time-series collection with retention. "
+            "Stop the delivery cost calculator before running it."
+        )
+    )
+    parser.add_argument(
+        "--drop-legacy",
+        action="store_true",
+        help="Drop the deliveries_legacy collection once its data is copied.",
+    )
+    args = parser.parse_args()
+    asyncio.run(main(args.drop_legacy))
@@ -0,0 +1,51 @@
+"""02_query_indexes
+
+Revision ID: 5f0d9c2a71b3
+Revises: 248c4248a420
+Create Date: 2026-10-18 12:04:37.218406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "5f0d9c2a71b3"
+down_revision = "248c4248a420"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "packages",
+        sa.Column(
+            "needs_calculation",
+            sa.Boolean(),
+            sa.Computed("delivery_cost IS NULL", persisted=False),
+        ),
+    )
+    op.create_index(
+        "ix_packages_needs_calculation_id", "packages", ["needs_calculation", "id"]
+    )
+    op.create_index("ix_packages_user_id_id", "packages", ["user_id", "id"])
+    op.create_index(
+        "ix_packages_user_id_type_id_id", "packages", ["user_id", "type_id", "id"]
+    )
+    op.create_index(
+        "ix_packages_user_id_needs_calculation_id",
+        "packages",
+        ["user_id", "needs_calculation", "id"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_packages_user_id_needs_calculation_id", table_name="packages")
+    op.drop_index("ix_packages_user_id_type_id_id", table_name="packages")
+    # MySQL may have dropped the implicit foreign key index on user_id in favour
+    # of the composite one, so put it back before the composite index goes.
+    indexes = sa.inspect(op.get_bind()).get_indexes("packages")
+    if "user_id" not in {index["name"] for index in indexes}:
+        op.create_index("user_id", "packages", ["user_id"])
+    op.drop_index("ix_packages_user_id_id", table_name="packages")
+    op.drop_index("ix_packages_needs_calculation_id", table_name="packages")
+    op.drop_column("packages", "needs_calculation")
@@ -0,0 +1,26 @@
+"""03_claim_index
+
+Revision ID: a81e4f6c2d97
+Revises: 5f0d9c2a71b3
+Create Date: 2026-10-18 15:42:09.530117
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "a81e4f6c2d97"
+down_revision = "5f0d9c2a71b3"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_packages_company_id_needs_calculation_id",
+        "packages",
+        ["company_id", "needs_calculation", "id"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_packages_company_id_needs_calculation_id", table_name="packages")
@@ -0,0 +1,43 @@
+import argparse
+import asyncio
+from datetime import datetime
+
+from core.settings import settings
+from infrastructure.mongo_client import MongoClient
+from infrastructure.redis_client import get_redis_client
+from infrastructure.redis_temporary_storage import RedisTemporaryStorage
+from services.use_cases.package_cost_calculator import rebuild_daily_totals
+
+
+async def main(date_from: datetime, date_to: datetime):
+    log_repository = MongoClient(config=settings)
+    redis_client = get_redis_client(settings)
+    temp_storage = RedisTemporaryStorage(config=settings, redis_client=redis_client)
+    try:
+        await log_repository.ensure_indexes()
+        await rebuild_daily_totals(log_repository, temp_storage, date_from, date_to)
+    finally:
+        log_repository.close()
+        await redis_client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=(
+            "Rebuild daily delivery cost totals of closed days from raw calculation "
+            "logs. The current day is still being written to (raw logs are buffered "
+            "by the calculator), so it cannot be rebuilt."
+        )
+    )
+    parser.add_argument(
+        "--from", dest="date_from", type=datetime.fromisoformat, required=True
+    )
+    parser.add_argument(
+        "--to", dest="date_to", type=datetime.fromisoformat, required=True
+    )
+    args = parser.parse_args()
+    if args.date_from.date() > args.date_to.date():
+        parser.error("--from must not be after --to")
+    if args.date_to.date() >= datetime.now().date():
+        parser.error("only closed days can be rebuilt, --to must be before today")
+    asyncio.run(main(args.date_from, args.date_to))
@@ -1,7 +1,8 @@
 from datetime import datetime
+from enum import Enum
 from typing import Optional, Union
 
-from pydantic import BaseModel, condecimal, constr, root_validator
+from pydantic import BaseModel, condecimal, conlist, constr, root_validator
 
 
 class PackageCreate(BaseModel):
@@ -21,6 +22,34 @@ class PackageResponse(BaseModel):
         orm_mode = True
 
 
+class PackageBatchItemResult(BaseModel):
+    index: int
+    id: Optional[int]
+    errors: Optional[list[dict]]
+
+
+class PackageBatchResponse(BaseModel):
+    registered: int
+    failed: int
+    items: list[PackageBatchItemResult]
+
+
+class PackageAssignmentStatus(str, Enum):
+    assigned = "assigned"
+    already_assigned = "already_assigned"
+    not_found = "not_found"
+
+
+class PackageAssignmentRequest(BaseModel):
+    company_id: int
+    package_ids: conlist(int, min_items=1)
+
+
+class PackageAssignmentResult(BaseModel):
+    package_id: int
+    status: PackageAssignmentStatus
+
+
 class PackageTypeModel(BaseModel):
     id: int
     name: str
@@ -48,11 +77,28 @@ class PackageInfo(BaseModel):
         return values
 
 
+class PackageCacheEntry(BaseModel):
+    user_id: str
+    version: int
+    package: PackageInfo
+
+
+class PackageLookupRequest(BaseModel):
+    ids: conlist(int, min_items=1)
+
+
+class PackageLookupResult(BaseModel):
+    id: int
+    found: bool
+    package: Optional[PackageInfo]
+
+
 class MyPackages(BaseModel):
-    page: int
+    page: Optional[int]
     page_size: int
-    total_items: int
+    total_items: Optional[int]
     data: list[PackageInfo]
+    next_cursor: Optional[str]
 
 
 class UserInfo(BaseModel):
@@ -86,3 +132,72 @@ class CalculationLogAggregatedModel(BaseModel):
     package_type_id: int
     delivery_cost_sum: float
     date: str
+
+
+class CalculationLogRangeAggregatedModel(BaseModel):
+    date: str
+    package_type_id: int
+    delivery_cost_sum: float
+    count: int
+    delivery_cost_avg: float
+
+
+class DailyDeliveryTotalModel(BaseModel):
+    date: str
+    package_type_id: int
+    delivery_cost_sum: float
+    count: int
+    delivery_cost_min: float
+    delivery_cost_max: float
+
+
+class RateProviderMetrics(BaseModel):
+    cache_hits: int = 0
+    cache_misses: int = 0
+    fetches: int = 0
+    fetch_failures: int = 0
+    stale_fallbacks: int = 0
+    circuit_open_rejections: int = 0
+    last_fetch_latency: Optional[float] = None
+    total_fetch_latency: float = 0.0
+
+
+class PackageCacheMetrics(BaseModel):
+    hits: int = 0
+    misses: int = 0
+    coalesced: int = 0
+    invalidations: int = 0
+    stale_writes_skipped: int = 0
+    hit_ratio: float = 0.0
+    last_latency: Optional[float] = None
+    total_latency: float = 0.0
+
+
+class LogSinkMetrics(BaseModel):
+    docs_written: int = 0
+    docs_failed: int = 0
+    chunks_written: int = 0
+    write_retries: int = 0
+    daily_totals_failed: int = 0
+    write_seconds: float = 0.0
+    docs_per_second: float = 0.0
+    buffered: int = 0
+
+
+class CalculationJobStatus(str, Enum):
+    queued = "queued"
+    running = "running"
+    completed = "completed"
+    failed = "failed"
+
+
+class CalculationJobModel(BaseModel):
+    id: str
+    status: CalculationJobStatus
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    heartbeat_at: Optional[datetime] = None
+    packages_processed: int = 0
+    throughput: Optional[float] = None
+    error: Optional[str] = None
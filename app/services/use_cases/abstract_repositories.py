@@ -1,17 +1,19 @@
 from abc import ABC, abstractmethod
 from datetime import datetime
-from typing import Optional
+from typing import AsyncIterator, Optional
 
 from app.schemas import (
+    PackageAssignmentStatus,
     CalculationLogAggregatedModel,
     CalculationLogModel,
-    MyPackages,
+    CalculationLogRangeAggregatedModel,
+    DailyDeliveryTotalModel,
+    PackageCacheEntry,
     PackageCreate,
     PackageInfo,
     PackageResponse,
     PackageToCalc,
     PackageTypeModel,
-    UserInfo,
 )
 
 
@@ -22,10 +24,32 @@ class DeltaAbstractRepository(ABC):
     ) -> PackageResponse:
         pass
 
+    @abstractmethod
+    async def register_packages(
+        self, packages: list[PackageCreate], user_id: str
+    ) -> list[int]:
+        pass
+
+    @abstractmethod
+    async def register_packages_for_users(
+        self, registrations: list[tuple[PackageCreate, str]]
+    ) -> list[int]:
+        pass
+
     @abstractmethod
     async def get_package_types(self) -> list[PackageTypeModel]:
         pass
 
+    @abstractmethod
+    async def get_package_types_with_version(
+        self,
+    ) -> tuple[list[PackageTypeModel], str]:
+        pass
+
+    @abstractmethod
+    def invalidate_package_types(self) -> None:
+        pass
+
     @abstractmethod
     async def get_my_packages(
         self,
@@ -34,7 +58,17 @@ class DeltaAbstractRepository(ABC):
         delivery_cost_calculated: Optional[bool],
         offset: int,
         limit: int,
-    ) -> MyPackages:
+        after_id: Optional[int] = None,
+    ) -> list[PackageInfo]:
+        pass
+
+    @abstractmethod
+    async def count_my_packages(
+        self,
+        user_id: str,
+        type_id: Optional[int],
+        delivery_cost_calculated: Optional[bool],
+    ) -> int:
         pass
 
     @abstractmethod
@@ -42,27 +76,73 @@ class DeltaAbstractRepository(ABC):
         pass
 
     @abstractmethod
-    async def get_or_create_user(self, user_id: str) -> UserInfo:
+    async def get_package_entry(self, package_id: int) -> Optional[PackageCacheEntry]:
+        pass
+
+    @abstractmethod
+    async def get_packages(
+        self, user_id: str, package_ids: list[int]
+    ) -> dict[int, PackageInfo]:
+        pass
+
+    @abstractmethod
+    async def upsert_users(self, last_access: dict[str, datetime]) -> None:
         pass
 
     @abstractmethod
-    async def get_packages_to_calc(self) -> list[PackageToCalc]:
+    async def get_pending_id_bounds(self) -> Optional[tuple[int, int]]:
+        pass
+
+    @abstractmethod
+    async def get_packages_to_calc(
+        self, after_id: int, limit: int, max_id: Optional[int] = None
+    ) -> list[PackageToCalc]:
+        pass
+
+    @abstractmethod
+    async def get_packages_to_calc_by_ids(
+        self, package_ids: list[int]
+    ) -> list[PackageToCalc]:
+        pass
+
+    @abstractmethod
+    def iter_packages_to_calc(
+        self, batch_size: int, after_id: int = 0, max_id: Optional[int] = None
+    ) -> AsyncIterator[list[PackageToCalc]]:
         pass
 
     @abstractmethod
     async def update_delivery_costs(
         self, packages_to_update: list[PackageToCalc]
-    ) -> None:
+    ) -> int:
         pass
 
     @abstractmethod
     async def assign_package(self, package_id: int, company_id: int) -> None:
         pass
 
+    @abstractmethod
+    async def claim_packages(self, company_id: int, limit: int) -> list[PackageInfo]:
+        pass
+
+    @abstractmethod
+    async def assign_packages(
+        self, package_ids: list[int], company_id: int
+    ) -> dict[int, PackageAssignmentStatus]:
+        pass
+
 
 class AbstractCalculationLogRepository(ABC):
     @abstractmethod
-    async def add_calc_data(self, calc_log_models: list[CalculationLogModel]) -> None:
+    async def add_calc_data(
+        self, calc_log_models: list[CalculationLogModel]
+    ) -> list[CalculationLogModel]:
+        pass
+
+    @abstractmethod
+    async def add_daily_totals(
+        self, daily_totals: list[DailyDeliveryTotalModel]
+    ) -> int:
         pass
 
     @abstractmethod
@@ -71,20 +151,100 @@ class AbstractCalculationLogRepository(ABC):
     ) -> list[CalculationLogAggregatedModel]:
         pass
 
+    @abstractmethod
+    async def get_aggregated_data_range(
+        self, date_from: datetime, date_to: datetime
+    ) -> list[CalculationLogRangeAggregatedModel]:
+        pass
+
+    @abstractmethod
+    async def rebuild_daily_totals(self, date_from: datetime, date_to: datetime) -> int:
+        pass
+
+    @abstractmethod
+    def get_compaction_window(self) -> Optional[tuple[datetime, datetime]]:
+        pass
+
+
+class AbstractCalculationLogSink(ABC):
+    @abstractmethod
+    async def add_calc_data(self, calc_log_models: list[CalculationLogModel]) -> None:
+        pass
+
+    @abstractmethod
+    async def flush(self) -> None:
+        pass
+
+    @abstractmethod
+    async def close(self) -> None:
+        pass
+
 
 class DeltaAbstractTemporaryStorage(ABC):
     @abstractmethod
-    def save_key_value(self, key: str, value: str, expiration_time: int) -> None:
+    async def save_key_value(self, key: str, value: str, expiration_time: int) -> None:
+        pass
+
+    @abstractmethod
+    async def get_value(self, key: str):
+        pass
+
+    @abstractmethod
+    async def get_many(self, keys: list[str]) -> list:
+        pass
+
+    @abstractmethod
+    async def delete_key(self, key: str):
+        pass
+
+    @abstractmethod
+    async def delete_keys(self, keys: list[str]) -> None:
+        pass
+
+    @abstractmethod
+    async def save_key_value_without_exp(self, key: str, value: str) -> None:
+        pass
+
+    @abstractmethod
+    async def save_many(
+        self, values: dict[str, str], expiration_time: Optional[int] = None
+    ) -> None:
+        pass
+
+    @abstractmethod
+    async def save_if_newer(
+        self, key: str, value: str, version: int, expiration_time: int
+    ) -> bool:
+        pass
+
+    @abstractmethod
+    async def acquire_lease(self, key: str, owner: str, expiration_time: int) -> bool:
+        pass
+
+    @abstractmethod
+    async def renew_lease(self, key: str, owner: str, expiration_time: int) -> bool:
+        pass
+
+    @abstractmethod
+    async def release_lease(self, key: str, owner: str) -> None:
+        pass
+
+
+class DeltaAbstractPackageQueue(ABC):
+    @abstractmethod
+    async def publish_package(self, package_id: int) -> None:
         pass
 
     @abstractmethod
-    def get_value(self, key: str):
+    async def publish_packages(self, package_ids: list[int]) -> None:
         pass
 
     @abstractmethod
-    def delete_key(self, key: str):
+    async def read_packages(
+        self, consumer: str, count: int
+    ) -> dict[str, Optional[int]]:
         pass
 
     @abstractmethod
-    def save_key_value_without_exp(self, key: str, value: str) -> None:
+    async def ack_packages(self, entry_ids: list[str]) -> None:
         pass
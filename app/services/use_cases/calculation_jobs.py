@@ -0,0 +1,159 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+from uuid import uuid4
+
+from app.core.settings import Settings
+from app.infrastructure.utils import (
+    CalculationJobLeaseLostException,
+    CalculationJobUnavailableException,
+)
+from app.schemas import CalculationJobModel, CalculationJobStatus
+from app.services.use_cases.abstract_repositories import DeltaAbstractTemporaryStorage
+from app.services.use_cases.package_cost_calculator import PackageCostCalculator
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+ACTIVE_JOB_KEY = "calculation_job:active"
+
+
+class CalculationJobManager:
+    def __init__(
+        self,
+        calculator_factory: Callable[[], PackageCostCalculator],
+        temp_storage: DeltaAbstractTemporaryStorage,
+        config: Settings,
+    ):
+        self.calculator_factory = calculator_factory
+        self.temp_storage = temp_storage
+        self.config = config
+        self.running: dict[str, tuple[asyncio.Task, PackageCostCalculator]] = {}
+
+    @staticmethod
+    def get_job_key(job_id: str) -> str:
+        return f"calculation_job:{job_id}"
+
+    async def start_job(self) -> CalculationJobModel:
+        job = CalculationJobModel(
+            id=uuid4().hex,
+            status=CalculationJobStatus.queued,
+            created_at=datetime.now(),
+        )
+        for _ in range(self.config.calculation_job_start_attempts):
+            if await self.temp_storage.acquire_lease(
+                ACTIVE_JOB_KEY, job.id, self.config.calculation_job_lock_ttl
+            ):
+                break
+            active_job_id = await self.temp_storage.get_value(ACTIVE_JOB_KEY)
+            active_job = None
+            if active_job_id:
+                active_job = await self.get_job(active_job_id.decode("utf-8"))
+            if active_job and active_job.status in (
+                CalculationJobStatus.queued,
+                CalculationJobStatus.running,
+            ):
+                logger.info("Calculation job %s is already running.", active_job.id)
+                return active_job
+            # The holder has not saved its job yet, failed to, or was abandoned
+            # and its lease is about to expire.
+            await asyncio.sleep(self.config.calculation_job_start_poll_interval)
+        else:
+            raise CalculationJobUnavailableException(
+                "Another calculation job is starting"
+            )
+
+        await self.save_job(job)
+        calculator = self.calculator_factory()
+        task = asyncio.create_task(self.run_job(job, calculator))
+        self.running[job.id] = (task, calculator)
+        task.add_done_callback(lambda _: self.running.pop(job.id, None))
+        logger.info("Calculation job %s queued.", job.id)
+        return job
+
+    async def get_job(self, job_id: str) -> Optional[CalculationJobModel]:
+        job_raw = await self.temp_storage.get_value(self.get_job_key(job_id))
+        if job_raw is None:
+            return None
+        job = CalculationJobModel.parse_raw(job_raw)
+        if job.status in (
+            CalculationJobStatus.queued,
+            CalculationJobStatus.running,
+        ) and self.is_abandoned(job):
+            job.status = CalculationJobStatus.failed
+            job.error = "Calculation job stopped sending heartbeats"
+        return job
+
+    def is_abandoned(self, job: CalculationJobModel) -> bool:
+        # A job is saved on every heartbeat, together with its lease renewal.
+        heartbeat_at = job.heartbeat_at or job.created_at
+        lock_ttl = timedelta(seconds=self.config.calculation_job_lock_ttl)
+        return datetime.now() - heartbeat_at > lock_ttl
+
+    async def save_job(self, job: CalculationJobModel) -> None:
+        job.heartbeat_at = datetime.now()
+        await self.temp_storage.save_key_value(
+            self.get_job_key(job.id), job.json(), self.config.calculation_job_ttl
+        )
+
+    async def run_job(
+        self, job: CalculationJobModel, calculator: PackageCostCalculator
+    ) -> None:
+        job.status = CalculationJobStatus.running
+        job.started_at = datetime.now()
+        await self.save_job(job)
+        calculation = asyncio.create_task(calculator.calculate_delivery_cost())
+        heartbeat_interval = self.config.calculation_job_heartbeat_interval
+        try:
+            while not calculation.done():
+                await asyncio.wait({calculation}, timeout=heartbeat_interval)
+                if not calculation.done():
+                    self.update_progress(job, calculator)
+                    if not await self.temp_storage.renew_lease(
+                        ACTIVE_JOB_KEY, job.id, self.config.calculation_job_lock_ttl
+                    ):
+                        raise CalculationJobLeaseLostException(
+                            "Calculation job lost its lease"
+                        )
+                    await self.save_job(job)
+            calculation.result()
+            job.status = CalculationJobStatus.completed
+        except Exception as e:
+            logger.exception("Calculation job %s failed.", job.id)
+            job.status = CalculationJobStatus.failed
+            job.error = str(e) or repr(e)
+        finally:
+            if not calculation.done():
+                # Another job may start once the lease is released, so the
+                # calculation has to be stopped first.
+                calculator.request_stop()
+                await asyncio.gather(calculation, return_exceptions=True)
+            job.finished_at = datetime.now()
+            self.update_progress(job, calculator)
+            try:
+                await self.save_job(job)
+            finally:
+                await self.temp_storage.release_lease(ACTIVE_JOB_KEY, job.id)
+            logger.info(
+                "Calculation job %s %s, %s packages processed.",
+                job.id,
+                job.status.value,
+                job.packages_processed,
+            )
+
+    @staticmethod
+    def update_progress(
+        job: CalculationJobModel, calculator: PackageCostCalculator
+    ) -> None:
+        job.packages_processed = calculator.packages_processed
+        elapsed = ((job.finished_at or datetime.now()) - job.started_at).total_seconds()
+        if elapsed > 0:
+            job.throughput = job.packages_processed / elapsed
+
+    async def shutdown(self) -> None:
+        for task, calculator in list(self.running.values()):
+            calculator.request_stop()
+        await asyncio.gather(
+            *(task for task, _ in list(self.running.values())), return_exceptions=True
+        )
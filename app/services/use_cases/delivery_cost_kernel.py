@@ -0,0 +1,104 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import NamedTuple
+
+import numpy as np
+
+from app.schemas import CalculationLogModel, DailyDeliveryTotalModel, PackageToCalc
+
+WEIGHT_FACTOR = 0.5
+CONTENT_VALUE_FACTOR = 0.01
+
+
+class PackageColumns(NamedTuple):
+    ids: np.ndarray
+    type_ids: np.ndarray
+    weights: np.ndarray
+    content_values: np.ndarray
+
+    @classmethod
+    def from_packages(cls, packages: list[PackageToCalc]) -> "PackageColumns":
+        count = len(packages)
+        return cls(
+            ids=np.fromiter((p.id for p in packages), np.int64, count),
+            type_ids=np.fromiter((p.package_type_id for p in packages), np.int64, count),
+            weights=np.fromiter((p.weight for p in packages), np.float64, count),
+            content_values=np.fromiter(
+                (p.content_value for p in packages), np.float64, count
+            ),
+        )
+
+
+def calculate_delivery_costs(
+    weights: np.ndarray, content_values: np.ndarray, rate: float
+) -> np.ndarray:
+    return (weights * WEIGHT_FACTOR + content_values * CONTENT_VALUE_FACTOR) * rate
+
+
+def build_calculation_logs(
+    columns: PackageColumns, delivery_costs: np.ndarray, date: datetime
+) -> list[CalculationLogModel]:
+    return [
+        CalculationLogModel.construct(
+            package_id=package_id,
+            package_type_id=package_type_id,
+            delivery_cost=delivery_cost,
+            date=date,
+        )
+        for package_id, package_type_id, delivery_cost in zip(
+            columns.ids.tolist(), columns.type_ids.tolist(), delivery_costs.tolist()
+        )
+    ]
+
+
+def aggregate_daily_totals(
+    type_ids: np.ndarray, delivery_costs: np.ndarray, date: datetime
+) -> list[DailyDeliveryTotalModel]:
+    order = np.argsort(type_ids, kind="stable")
+    sorted_costs = delivery_costs[order]
+    package_type_ids, starts, counts = np.unique(
+        type_ids[order], return_index=True, return_counts=True
+    )
+    formatted_date = date.strftime("%Y-%m-%d")
+    return [
+        DailyDeliveryTotalModel(
+            date=formatted_date,
+            package_type_id=package_type_id,
+            delivery_cost_sum=delivery_cost_sum,
+            count=count,
+            delivery_cost_min=delivery_cost_min,
+            delivery_cost_max=delivery_cost_max,
+        )
+        for (
+            package_type_id,
+            count,
+            delivery_cost_sum,
+            delivery_cost_min,
+            delivery_cost_max,
+        ) in zip(
+            package_type_ids.tolist(),
+            counts.tolist(),
+            np.add.reduceat(sorted_costs, starts).tolist(),
+            np.minimum.reduceat(sorted_costs, starts).tolist(),
+            np.maximum.reduceat(sorted_costs, starts).tolist(),
+        )
+    ]
+
+
+def aggregate_calculation_logs(
+    calc_logs: list[CalculationLogModel],
+) -> list[DailyDeliveryTotalModel]:
+    logs_by_day = defaultdict(list)
+    for calc_log in calc_logs:
+        logs_by_day[calc_log.date.date()].append(calc_log)
+    daily_totals = []
+    for day_logs in logs_by_day.values():
+        count = len(day_logs)
+        daily_totals.extend(
+            aggregate_daily_totals(
+                np.fromiter((log.package_type_id for log in day_logs), np.int64, count),
+                np.fromiter((log.delivery_cost for log in day_logs), np.float64, count),
+                day_logs[0].date,
+            )
+        )
+    return daily_totals
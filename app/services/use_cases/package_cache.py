@@ -0,0 +1,122 @@
+import asyncio
+import json
+import logging
+from time import monotonic
+from typing import Optional
+
+from app.core.settings import Settings
+from app.schemas import PackageCacheEntry, PackageCacheMetrics, PackageInfo
+from app.services.use_cases.abstract_repositories import (
+    DeltaAbstractRepository,
+    DeltaAbstractTemporaryStorage,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("package_service")
+
+PACKAGE_TOMBSTONE = json.dumps({"tombstone": True})
+
+
+class PackageCache:
+    def __init__(
+        self,
+        repository: DeltaAbstractRepository,
+        temp_storage: DeltaAbstractTemporaryStorage,
+        config: Settings,
+    ):
+        self.repository = repository
+        self.temp_storage = temp_storage
+        self.config = config
+        self.loads: dict[int, asyncio.Future] = {}
+        self.metrics = PackageCacheMetrics()
+
+    def get_cache_key(self, package_id: int) -> str:
+        # Databases sharing one Redis must not see each other's packages.
+        return f"package:{self.config.mysql_db}:{package_id}"
+
+    async def get_package(self, user_id: str, package_id: int) -> Optional[PackageInfo]:
+        started = monotonic()
+        try:
+            entry = await self.get_cached_entry(package_id)
+            if entry is not None:
+                self.metrics.hits += 1
+            else:
+                self.metrics.misses += 1
+                load = self.loads.get(package_id)
+                if load is None:
+                    load = asyncio.ensure_future(self.load_entry(package_id))
+                    self.loads[package_id] = load
+                    load.add_done_callback(lambda _: self.loads.pop(package_id, None))
+                else:
+                    self.metrics.coalesced += 1
+                entry = await asyncio.shield(load)
+        finally:
+            latency = monotonic() - started
+            self.metrics.last_latency = latency
+            self.metrics.total_latency += latency
+        if entry is None or entry.user_id != user_id:
+            return None
+        return entry.package
+
+    async def get_cached_entry(self, package_id: int) -> Optional[PackageCacheEntry]:
+        try:
+            cached = await self.temp_storage.get_value(self.get_cache_key(package_id))
+        except Exception as e:
+            logger.warning("Package cache read failed for %s: %s", package_id, e)
+            return None
+        if not cached:
+            return None
+        data = json.loads(cached)
+        if "version" not in data:
+            return None
+        return PackageCacheEntry.parse_obj(data)
+
+    async def load_entry(self, package_id: int) -> Optional[PackageCacheEntry]:
+        started = monotonic()
+        entry = await self.repository.get_package_entry(package_id)
+        if entry is None:
+            return None
+        if monotonic() - started > self.config.package_cache_load_timeout:
+            # The load timeout is kept below the tombstone TTL. A slower load may
+            # have outlived a writer's tombstone, so its row could be outdated.
+            self.metrics.stale_writes_skipped += 1
+            return entry
+        try:
+            # A reader holding an older row than the cache, or racing a writer's
+            # tombstone, must not put it back.
+            if not await self.temp_storage.save_if_newer(
+                self.get_cache_key(package_id),
+                entry.json(),
+                entry.version,
+                self.config.package_cache_ttl,
+            ):
+                self.metrics.stale_writes_skipped += 1
+        except Exception as e:
+            logger.warning("Package cache write failed for %s: %s", package_id, e)
+        return entry
+
+    async def invalidate(self, package_ids: list[int]) -> None:
+        if not package_ids:
+            return
+        try:
+            await self.temp_storage.save_many(
+                {
+                    self.get_cache_key(package_id): PACKAGE_TOMBSTONE
+                    for package_id in package_ids
+                },
+                self.config.package_cache_tombstone_ttl,
+            )
+            self.metrics.invalidations += len(package_ids)
+        except Exception as e:
+            logger.error(
+                "Cached packages not invalidated, they stay stale for up to %s s: %s",
+                self.config.package_cache_ttl,
+                e,
+            )
+
+    def get_metrics(self) -> PackageCacheMetrics:
+        metrics = self.metrics.copy()
+        lookups = metrics.hits + metrics.misses
+        if lookups:
+            metrics.hit_ratio = metrics.hits / lookups
+        return metrics
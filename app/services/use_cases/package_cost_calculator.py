@@ -1,110 +1,301 @@
+import asyncio
+import json
 import logging
+import os
+import socket
+from collections import defaultdict
 from datetime import datetime, timedelta
 from typing import Optional
+from uuid import uuid4
 
-import httpx
+from pydantic import parse_raw_as
 
 from app.core.settings import Settings
-from app.schemas import CalculationLogAggregatedModel, CalculationLogModel
+from app.infrastructure.utils import ExchangeRateUnavailableException
+from app.schemas import (
+    CalculationLogAggregatedModel,
+    CalculationLogRangeAggregatedModel,
+    PackageToCalc,
+)
 from app.services.use_cases.abstract_repositories import (
     AbstractCalculationLogRepository,
+    AbstractCalculationLogSink,
+    DeltaAbstractPackageQueue,
     DeltaAbstractRepository,
     DeltaAbstractTemporaryStorage,
 )
+from app.services.use_cases.delivery_cost_kernel import (
+    build_calculation_logs,
+    calculate_delivery_costs,
+    PackageColumns,
+)
+from app.services.use_cases.package_cache import PackageCache
+from app.services.use_cases.rate_provider import RateProvider
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
 
+def get_aggregated_data_cache_key(date: datetime) -> str:
+    return f"aggregated_data:{date.strftime('%Y-%m-%d')}"
+
+
+async def rebuild_daily_totals(
+    log_repository: AbstractCalculationLogRepository,
+    temp_storage: DeltaAbstractTemporaryStorage,
+    date_from: datetime,
+    date_to: datetime,
+) -> int:
+    # Cached closed days live for a week, so every rebuild has to drop them.
+    rebuilt = await log_repository.rebuild_daily_totals(date_from, date_to)
+    await temp_storage.delete_keys(
+        [
+            get_aggregated_data_cache_key(date_from + timedelta(days=offset))
+            for offset in range((date_to.date() - date_from.date()).days + 1)
+        ]
+    )
+    return rebuilt
+
+
+async def compact_calculation_logs(
+    log_repository: AbstractCalculationLogRepository,
+    temp_storage: DeltaAbstractTemporaryStorage,
+) -> int:
+    window = log_repository.get_compaction_window()
+    if window is None:
+        return 0
+    return await rebuild_daily_totals(log_repository, temp_storage, *window)
+
+
 class PackageCostCalculator:
     def __init__(
         self,
         repository: DeltaAbstractRepository,
         temp_storage: DeltaAbstractTemporaryStorage,
         log_repository: AbstractCalculationLogRepository,
+        log_sink: AbstractCalculationLogSink,
+        package_queue: DeltaAbstractPackageQueue,
+        rate_provider: RateProvider,
+        package_cache: PackageCache,
         config: Settings,
     ):
         self.repository = repository
         self.temp_storage = temp_storage
         self.log_repository = log_repository
+        self.log_sink = log_sink
+        self.package_queue = package_queue
+        self.rate_provider = rate_provider
+        self.package_cache = package_cache
         self.config = config
+        self.stop_requested = False
+        self.packages_processed = 0
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        self._run_lock = asyncio.Lock()
         logger.info("PackageCostCalculator service has been initialized.")
 
-    @staticmethod
-    def get_date_code() -> str:
-        today = datetime.now()
-        if today.weekday() not in [5, 6]:
-            date_code = today.strftime("%Y-%m-%d")
-        else:
-            last_friday = today - timedelta(days=today.weekday() - 4)
-            date_code = last_friday.strftime("%Y-%m-%d")
-        logger.debug(f"Date code for rate lookup: {date_code}")
-        return date_code
+    def request_stop(self) -> None:
+        self.stop_requested = True
 
     async def get_current_exchange_rate(self, currency: str) -> Optional[float]:
-        currency_key = f"{self.get_date_code()}{currency}"
-        if rate_raw := self.temp_storage.get_value(currency_key):
-            logger.info(f"Exchange rate for {currency} found in temporary storage.")
-            return float(rate_raw.decode("utf-8"))
-
-        logger.info(
-            f"Retrieving current exchange rate for {currency} from external service."
-        )
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(self.config.currency_data_source)
-                response.raise_for_status()
-                data = response.json()
-                current_date_key = self.get_date_code()
-                rate = None
-                for currency_code, currency_data in data["Valute"].items():
-                    value = currency_data["Value"]
-                    key = f"{current_date_key}{currency_code}"
-                    self.temp_storage.save_key_value_without_exp(key, value)
-                    if currency_code == currency:
-                        rate = value
-                logger.info(
-                    f"Exchange rate for {currency} retrieved and stored in temporary storage."
-                )
-                return float(rate)
-        except httpx.HTTPError as e:
-            logger.error(f"HTTP error occurred while fetching exchange rate: {e}")
-        except Exception as e:
-            logger.error(f"An error occurred while fetching exchange rate: {e}")
+        return await self.rate_provider.get_rate(currency)
 
     async def calculate_delivery_cost(self) -> None:
+        if self._run_lock.locked():
+            logger.warning("Delivery cost calculation is already running. Skipping.")
+            return
+        async with self._run_lock:
+            try:
+                await self._calculate_delivery_cost()
+            finally:
+                await self.log_sink.flush()
+
+    async def calculate_new_packages(self) -> None:
+        if self._run_lock.locked():
+            logger.warning("Delivery cost calculation is already running. Skipping.")
+            return
+        async with self._run_lock:
+            try:
+                await self._calculate_new_packages()
+            finally:
+                await self.log_sink.flush()
+
+    def get_lease_key(self, range_index: int) -> str:
+        range_size = self.config.calculation_lease_range_size
+        return f"calculation_lease:{range_size}:{range_index}"
+
+    async def _calculate_delivery_cost(self) -> None:
         logger.info("Starting delivery cost calculation.")
         rate = await self.get_current_exchange_rate(self.config.currency_calc_code)
         if rate is None:
             logger.critical(
                 "Failed to retrieve the current exchange rate for currency calculation. Aborting calculation."
             )
-            return
-        packages_to_calc = await self.repository.get_packages_to_calc()
-        if not packages_to_calc:
+            raise ExchangeRateUnavailableException(
+                f"Exchange rate for {self.config.currency_calc_code} is not available"
+            )
+        bounds = await self.repository.get_pending_id_bounds()
+        if bounds is None:
             logger.info("No packages found for delivery cost calculation.")
             return
-        calc_log_data = []
-        for package in packages_to_calc:
-            package.delivery_cost = (
-                package.weight * 0.5 + package.content_value * 0.01
-            ) * rate
-            logger.debug(
-                f"Calculated delivery cost for package {package.id}: {package.delivery_cost}"
-            )
-            calc_log_data.append(
-                CalculationLogModel(
-                    package_id=package.id,
-                    package_type_id=package.package_type_id,
-                    delivery_cost=package.delivery_cost,
-                    date=datetime.now(),
+        min_id, max_id = bounds
+        range_size = self.config.calculation_lease_range_size
+        processed = 0
+        first_range, last_range = (min_id - 1) // range_size, (max_id - 1) // range_size
+        for range_index in range(first_range, last_range + 1):
+            lease_key = self.get_lease_key(range_index)
+            if not await self.temp_storage.acquire_lease(
+                lease_key, self.worker_id, self.config.calculation_lease_ttl
+            ):
+                logger.debug(f"Range {range_index} is leased by another worker.")
+                continue
+            try:
+                processed += await self.calculate_range(
+                    range_index * range_size,
+                    (range_index + 1) * range_size,
+                    rate,
+                    lease_key,
+                )
+            finally:
+                await self.temp_storage.release_lease(lease_key, self.worker_id)
+            if self.stop_requested:
+                logger.info("Stop requested. Interrupting delivery cost calculation.")
+                return
+        logger.info(
+            f"Delivery cost calculation completed, {processed} packages calculated."
+        )
+
+    async def _calculate_new_packages(self) -> None:
+        rate = None
+        processed = 0
+        batch_size = self.config.calculation_batch_size
+        range_size = self.config.calculation_lease_range_size
+        while not self.stop_requested:
+            events = await self.package_queue.read_packages(self.worker_id, batch_size)
+            if not events:
+                break
+            if rate is None:
+                rate = await self.get_current_exchange_rate(
+                    self.config.currency_calc_code
                 )
+                if rate is None:
+                    logger.critical(
+                        "Failed to retrieve the current exchange rate. New packages stay pending."
+                    )
+                    return
+            processed_entries = [
+                entry_id for entry_id, package_id in events.items() if package_id is None
+            ]
+            events_by_range = defaultdict(dict)
+            for entry_id, package_id in events.items():
+                if package_id is not None:
+                    events_by_range[(package_id - 1) // range_size][entry_id] = package_id
+            for range_index, range_events in events_by_range.items():
+                lease_key = self.get_lease_key(range_index)
+                if not await self.temp_storage.acquire_lease(
+                    lease_key, self.worker_id, self.config.calculation_lease_ttl
+                ):
+                    # Left unacknowledged: claimed again after the idle timeout.
+                    continue
+                try:
+                    package_ids = list(range_events.values())
+                    packages_to_calc = (
+                        await self.repository.get_packages_to_calc_by_ids(package_ids)
+                    )
+                    if packages_to_calc:
+                        await self.calculate_batch(packages_to_calc, rate)
+                        processed += len(packages_to_calc)
+                    processed_entries.extend(range_events)
+                finally:
+                    await self.temp_storage.release_lease(lease_key, self.worker_id)
+            await self.package_queue.ack_packages(processed_entries)
+            if len(events) < batch_size:
+                break
+        if processed:
+            logger.info(f"Delivery cost calculated for {processed} new packages.")
+
+    async def calculate_range(
+        self, after_id: int, max_id: int, rate: float, lease_key: str
+    ) -> int:
+        processed = 0
+        async for packages_to_calc in self.repository.iter_packages_to_calc(
+            self.config.calculation_batch_size, after_id, max_id
+        ):
+            await self.calculate_batch(packages_to_calc, rate)
+            processed += len(packages_to_calc)
+            logger.info(
+                f"Delivery cost calculated for {processed} packages in ids "
+                f"({after_id}, {max_id}]."
+            )
+            if self.stop_requested:
+                break
+            if not await self.temp_storage.renew_lease(
+                lease_key, self.worker_id, self.config.calculation_lease_ttl
+            ):
+                logger.warning(f"Lease {lease_key} was lost. Leaving the range.")
+                break
+        return processed
+
+    async def calculate_batch(
+        self, packages_to_calc: list[PackageToCalc], rate: float
+    ) -> None:
+        columns = PackageColumns.from_packages(packages_to_calc)
+        delivery_costs = calculate_delivery_costs(
+            columns.weights, columns.content_values, rate
+        )
+        for package, delivery_cost in zip(packages_to_calc, delivery_costs.tolist()):
+            package.delivery_cost = delivery_cost
+        calculated_at = datetime.now()
+        calc_log_data = build_calculation_logs(columns, delivery_costs, calculated_at)
+        logger.debug(f"Calculated delivery cost for {len(packages_to_calc)} packages.")
+        updated_rows = await self.repository.update_delivery_costs(packages_to_calc)
+        self.packages_processed += len(packages_to_calc)
+        logger.info(f"Delivery cost written for {updated_rows} packages.")
+        # The costs are committed, so nothing below may fail the batch. Logs and
+        # their daily totals go through the sink, which retries them together.
+        await self.package_cache.invalidate(
+            [package.id for package in packages_to_calc]
+        )
+        await self.log_sink.add_calc_data(calc_log_data)
+        try:
+            await self.temp_storage.delete_key(
+                get_aggregated_data_cache_key(calculated_at)
             )
-        await self.repository.update_delivery_costs(packages_to_calc)
-        await self.log_repository.add_calc_data(calc_log_data)
-        logger.info("Delivery cost calculation completed.")
+        except Exception as e:
+            logger.warning(f"Aggregated data cache not invalidated: {e}")
 
     async def get_aggregated_data(
         self, date: datetime
     ) -> list[CalculationLogAggregatedModel]:
         return await self.log_repository.get_aggregated_data(date)
+
+    async def get_cached_aggregated_data(
+        self, date: datetime
+    ) -> tuple[list[CalculationLogAggregatedModel], str]:
+        cache_key = get_aggregated_data_cache_key(date)
+        try:
+            cached = await self.temp_storage.get_value(cache_key)
+        except Exception as e:
+            logger.warning(f"Aggregated data cache read failed for {cache_key}: {e}")
+            cached = None
+        if cached:
+            return parse_raw_as(list[CalculationLogAggregatedModel], cached), "HIT"
+
+        aggregated_data = await self.get_aggregated_data(date)
+        if date.date() < datetime.now().date():
+            expiration_time = self.config.aggregated_data_closed_day_ttl
+        else:
+            expiration_time = self.config.aggregated_data_current_day_ttl
+        try:
+            await self.temp_storage.save_key_value(
+                cache_key,
+                json.dumps([model.dict() for model in aggregated_data]),
+                expiration_time,
+            )
+        except Exception as e:
+            logger.warning(f"Aggregated data cache write failed for {cache_key}: {e}")
+        return aggregated_data, "MISS"
+
+    async def get_aggregated_data_range(
+        self, date_from: datetime, date_to: datetime
+    ) -> list[CalculationLogRangeAggregatedModel]:
+        return await self.log_repository.get_aggregated_data_range(date_from, date_to)
@@ -1,36 +1,200 @@
+import base64
+import binascii
+import json
 import logging
-from typing import Optional
+from typing import Any, Optional
 
+from pydantic import ValidationError
+
+from app.core.settings import Settings
+from app.infrastructure.utils import BatchTooLargeException, InvalidCursorException
 from app.schemas import (
     MyPackages,
+    PackageAssignmentResult,
+    PackageAssignmentStatus,
+    PackageBatchItemResult,
+    PackageBatchResponse,
     PackageCreate,
     PackageInfo,
+    PackageLookupResult,
     PackageResponse,
     PackageTypeModel,
 )
-from app.services.use_cases.abstract_repositories import DeltaAbstractRepository
+from app.services.use_cases.abstract_repositories import (
+    DeltaAbstractPackageQueue,
+    DeltaAbstractRepository,
+    DeltaAbstractTemporaryStorage,
+)
+from app.services.use_cases.package_cache import PackageCache
+from app.services.use_cases.registration_batcher import RegistrationBatcher
+from app.services.use_cases.session_tracker import SessionTracker
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("package_service")
 
 
+def encode_cursor(package_id: int) -> str:
+    raw = json.dumps({"after_id": package_id}).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        after_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))[
+            "after_id"
+        ]
+    except (binascii.Error, UnicodeError, ValueError, TypeError, KeyError) as e:
+        raise InvalidCursorException(f"Invalid cursor: {cursor}") from e
+    if not isinstance(after_id, int):
+        raise InvalidCursorException(f"Invalid cursor: {cursor}")
+    return after_id
+
+
+def get_my_packages_count_cache_key(
+    user_id: str, type_id: Optional[int], delivery_cost_calculated: Optional[bool]
+) -> str:
+    return f"my_packages_count:{user_id}:{type_id}:{delivery_cost_calculated}"
+
+
 class PackageService:
-    def __init__(self, repository: DeltaAbstractRepository):
+    def __init__(
+        self,
+        repository: DeltaAbstractRepository,
+        package_queue: DeltaAbstractPackageQueue,
+        temp_storage: DeltaAbstractTemporaryStorage,
+        session_tracker: SessionTracker,
+        registration_batcher: RegistrationBatcher,
+        package_cache: PackageCache,
+        config: Settings,
+    ):
         self.repository = repository
+        self.package_queue = package_queue
+        self.temp_storage = temp_storage
+        self.session_tracker = session_tracker
+        self.registration_batcher = registration_batcher
+        self.package_cache = package_cache
+        self.config = config
 
     async def register_package(
         self, package_data: PackageCreate, user_id: str
     ) -> PackageResponse:
         logger.info("Registering package for user_id: %s", user_id)
-        response = await self.repository.register_package(package_data, user_id)
+        if self.config.register_group_commit:
+            response = PackageResponse(
+                id=await self.registration_batcher.register(package_data, user_id)
+            )
+        else:
+            response = await self.repository.register_package(package_data, user_id)
         logger.info("Package registered with id: %s", response.id)
+        await self.reset_package_counts(user_id, {package_data.type_id})
+        try:
+            await self.package_queue.publish_package(response.id)
+        except Exception as e:
+            logger.warning(
+                "Package %s was not queued for calculation, "
+                "it will be picked up by the reconciliation scan: %s",
+                response.id,
+                e,
+            )
         return response
 
+    async def register_packages(
+        self, items: list[dict[str, Any]], user_id: str
+    ) -> PackageBatchResponse:
+        max_size = self.config.register_batch_max_size
+        if len(items) > max_size:
+            raise BatchTooLargeException(f"At most {max_size} packages per batch")
+        logger.info("Registering %s packages for user_id: %s", len(items), user_id)
+        type_ids = await self.get_package_type_ids()
+        results = []
+        valid_packages = []
+        for index, item in enumerate(items):
+            try:
+                package_data = PackageCreate.parse_obj(item)
+            except ValidationError as e:
+                results.append(PackageBatchItemResult(index=index, errors=e.errors()))
+                continue
+            if package_data.type_id not in type_ids:
+                results.append(
+                    PackageBatchItemResult(
+                        index=index,
+                        errors=[
+                            {
+                                "loc": ["type_id"],
+                                "msg": "unknown package type",
+                                "type": "value_error.package_type",
+                            }
+                        ],
+                    )
+                )
+                continue
+            results.append(PackageBatchItemResult(index=index))
+            valid_packages.append(package_data)
+
+        package_ids = []
+        if valid_packages:
+            package_ids = await self.repository.register_packages(
+                valid_packages, user_id
+            )
+        registered = iter(package_ids)
+        for result in results:
+            if result.errors is None:
+                result.id = next(registered)
+        logger.info(
+            "Packages registered for user_id: %s, %s rejected",
+            user_id,
+            len(items) - len(package_ids),
+        )
+
+        if package_ids:
+            await self.reset_package_counts(
+                user_id, {package_data.type_id for package_data in valid_packages}
+            )
+            try:
+                await self.package_queue.publish_packages(package_ids)
+            except Exception as e:
+                logger.warning(
+                    "%s packages were not queued for calculation, "
+                    "they will be picked up by the reconciliation scan: %s",
+                    len(package_ids),
+                    e,
+                )
+        return PackageBatchResponse(
+            registered=len(package_ids),
+            failed=len(items) - len(package_ids),
+            items=results,
+        )
+
+    async def get_package_type_ids(self) -> set[int]:
+        package_types = await self.repository.get_package_types()
+        return {package_type.id for package_type in package_types}
+
+    async def reset_package_counts(self, user_id: str, type_ids: set[int]) -> None:
+        try:
+            await self.temp_storage.delete_keys(
+                [
+                    get_my_packages_count_cache_key(user_id, type_id, calculated)
+                    for type_id in (None, *type_ids)
+                    for calculated in (None, False)
+                ]
+            )
+        except Exception as e:
+            logger.warning("Cached package counts of %s not reset: %s", user_id, e)
+
     async def get_package_types(self) -> list[PackageTypeModel]:
+        package_types, _ = await self.get_package_types_with_version()
+        return package_types
+
+    async def get_package_types_with_version(
+        self,
+    ) -> tuple[list[PackageTypeModel], str]:
         logger.info("Retrieving package types")
-        package_types = await self.repository.get_package_types()
+        package_types, version = await self.repository.get_package_types_with_version()
         logger.info("Package types retrieved: %s", package_types)
-        return package_types
+        return package_types, version
+
+    def invalidate_package_types(self) -> None:
+        self.repository.invalidate_package_types()
 
     async def get_my_packages(
         self,
@@ -39,27 +203,127 @@ class PackageService:
         delivery_cost_calculated: Optional[bool],
         offset: int,
         limit: int,
+        after: Optional[str] = None,
+        with_total: bool = True,
     ) -> MyPackages:
         logger.info("Retrieving packages for user_id: %s", user_id)
-        my_packages = await self.repository.get_my_packages(
-            user_id, type_id, delivery_cost_calculated, offset, limit
+        after_id = decode_cursor(after) if after is not None else None
+        packages = await self.repository.get_my_packages(
+            user_id, type_id, delivery_cost_calculated, offset, limit + 1, after_id
         )
+        next_cursor = None
+        if len(packages) > limit:
+            next_cursor = encode_cursor(packages[limit - 1].id)
+        total_items = None
+        if with_total:
+            total_items = await self.count_my_packages(
+                user_id, type_id, delivery_cost_calculated
+            )
         logger.info("Packages retrieved for user_id: %s", user_id)
-        return my_packages
+        return MyPackages(
+            page=offset // limit + 1 if after_id is None else None,
+            page_size=limit,
+            total_items=total_items,
+            data=packages[:limit],
+            next_cursor=next_cursor,
+        )
+
+    async def count_my_packages(
+        self,
+        user_id: str,
+        type_id: Optional[int],
+        delivery_cost_calculated: Optional[bool],
+    ) -> int:
+        cache_key = get_my_packages_count_cache_key(
+            user_id, type_id, delivery_cost_calculated
+        )
+        try:
+            cached = await self.temp_storage.get_value(cache_key)
+        except Exception as e:
+            logger.warning("Packages count cache read failed for %s: %s", cache_key, e)
+            cached = None
+        if cached:
+            return int(cached)
+        total_items = await self.repository.count_my_packages(
+            user_id, type_id, delivery_cost_calculated
+        )
+        try:
+            await self.temp_storage.save_key_value(
+                cache_key, str(total_items), self.config.my_packages_count_ttl
+            )
+        except Exception as e:
+            logger.warning("Packages count cache write failed for %s: %s", cache_key, e)
+        return total_items
 
     async def get_package(self, user_id: str, package_id: int) -> PackageInfo:
         logger.info(
             "Retrieving package with id: %s for user_id: %s", package_id, user_id
         )
-        package_info = await self.repository.get_package(user_id, package_id)
+        package_info = await self.package_cache.get_package(user_id, package_id)
         if package_info:
             logger.info("Package retrieved with id: %s", package_info.id)
         else:
             logger.info("Cant find package: %s for user %s", package_id, user_id)
         return package_info
 
+    async def get_packages(
+        self, user_id: str, package_ids: list[int]
+    ) -> list[PackageLookupResult]:
+        max_size = self.config.packages_lookup_max_size
+        if len(package_ids) > max_size:
+            raise BatchTooLargeException(f"At most {max_size} packages per request")
+        logger.info("Retrieving %s packages for user_id: %s", len(package_ids), user_id)
+        packages = await self.repository.get_packages(
+            user_id, list(dict.fromkeys(package_ids))
+        )
+        return [
+            PackageLookupResult(
+                id=package_id,
+                found=package_id in packages,
+                package=packages.get(package_id),
+            )
+            for package_id in package_ids
+        ]
+
     async def save_session(self, session_id: str) -> None:
-        await self.repository.get_or_create_user(session_id)
+        await self.session_tracker.track(session_id)
 
-    async def assign_package(self, package_id: int, company_id: int):
-        return await self.repository.assign_package(package_id, company_id)
+    async def assign_package(self, package_id: int, company_id: int) -> None:
+        await self.repository.assign_package(package_id, company_id)
+        await self.package_cache.invalidate([package_id])
+
+    async def claim_packages(self, company_id: int, limit: int) -> list[PackageInfo]:
+        max_size = self.config.assign_batch_max_size
+        if limit > max_size:
+            raise BatchTooLargeException(f"At most {max_size} packages per claim")
+        packages = await self.repository.claim_packages(company_id, limit)
+        await self.package_cache.invalidate([package.id for package in packages])
+        logger.info("Company %s claimed %s packages", company_id, len(packages))
+        return packages
+
+    async def assign_packages(
+        self, package_ids: list[int], company_id: int
+    ) -> list[PackageAssignmentResult]:
+        package_ids = list(dict.fromkeys(package_ids))
+        max_size = self.config.assign_batch_max_size
+        if len(package_ids) > max_size:
+            raise BatchTooLargeException(f"At most {max_size} packages per batch")
+        statuses = await self.repository.assign_packages(package_ids, company_id)
+        await self.package_cache.invalidate(
+            [
+                package_id
+                for package_id, package_status in statuses.items()
+                if package_status == PackageAssignmentStatus.assigned
+            ]
+        )
+        assigned = list(statuses.values()).count(PackageAssignmentStatus.assigned)
+        logger.info(
+            "Company %s assigned %s of %s packages",
+            company_id,
+            assigned,
+            len(package_ids),
+        )
+        return [
+            PackageAssignmentResult(package_id=package_id, status=statuses[package_id])
+            for package_id in package_ids
+        ]
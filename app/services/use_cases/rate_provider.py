@@ -0,0 +1,218 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import socket
+from datetime import datetime, timedelta
+from time import monotonic, time
+from typing import Optional
+from uuid import uuid4
+
+import httpx
+
+from app.core.settings import Settings
+from app.infrastructure.utils import RateProviderUnavailableException
+from app.schemas import RateProviderMetrics
+from app.services.use_cases.abstract_repositories import DeltaAbstractTemporaryStorage
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+LAST_KNOWN_RATES_KEY = "last_known_rates"
+
+
+class RateProvider:
+    def __init__(self, temp_storage: DeltaAbstractTemporaryStorage, config: Settings):
+        self.temp_storage = temp_storage
+        self.config = config
+        self.owner_id = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                config.rate_provider_read_timeout,
+                connect=config.rate_provider_connect_timeout,
+            )
+        )
+        self.refreshes: dict[str, asyncio.Future] = {}
+        self.consecutive_failures = 0
+        self.circuit_open_until = 0.0
+        self.metrics = RateProviderMetrics()
+        logger.info("RateProvider service has been initialized.")
+
+    @staticmethod
+    def get_date_code() -> str:
+        today = datetime.now()
+        if today.weekday() not in [5, 6]:
+            date_code = today.strftime("%Y-%m-%d")
+        else:
+            last_friday = today - timedelta(days=today.weekday() - 4)
+            date_code = last_friday.strftime("%Y-%m-%d")
+        logger.debug(f"Date code for rate lookup: {date_code}")
+        return date_code
+
+    async def get_rate(self, currency: str) -> Optional[float]:
+        date_code = self.get_date_code()
+        currency_key = f"{date_code}{currency}"
+        if rate_raw := await self.temp_storage.get_value(currency_key):
+            self.metrics.cache_hits += 1
+            logger.info(f"Exchange rate for {currency} found in temporary storage.")
+            return float(rate_raw.decode("utf-8"))
+        self.metrics.cache_misses += 1
+
+        if await self.temp_storage.get_value(f"rate_fetch_failed:{date_code}"):
+            logger.error(
+                f"Exchange rate fetch for {date_code} failed recently. Not retrying yet."
+            )
+        else:
+            refresh = self.refreshes.get(date_code)
+            if refresh is None:
+                refresh = asyncio.ensure_future(self.refresh_rates(date_code))
+                self.refreshes[date_code] = refresh
+                refresh.add_done_callback(lambda _: self.refreshes.pop(date_code, None))
+            await asyncio.shield(refresh)
+
+            if rate_raw := await self.temp_storage.get_value(currency_key):
+                return float(rate_raw.decode("utf-8"))
+        return await self.get_stale_rate(currency)
+
+    async def get_stale_rate(self, currency: str) -> Optional[float]:
+        last_known_raw = await self.temp_storage.get_value(LAST_KNOWN_RATES_KEY)
+        if not last_known_raw:
+            logger.error(f"No known exchange rate for {currency} to fall back to.")
+            return None
+        last_known = json.loads(last_known_raw)
+        age = time() - last_known["fetched_at"]
+        rate = last_known["rates"].get(currency)
+        if rate is None or age > self.config.rate_max_staleness:
+            logger.error(
+                f"Last known exchange rate for {currency} is missing or too old "
+                f"({age:.0f} s)."
+            )
+            return None
+        self.metrics.stale_fallbacks += 1
+        logger.warning(f"Using exchange rate for {currency} fetched {age:.0f} s ago.")
+        return float(rate)
+
+    async def refresh_rates(self, date_code: str) -> None:
+        lock_key = f"rate_fetch_lock:{date_code}"
+        loaded_key = f"rates_loaded:{date_code}"
+        failed_key = f"rate_fetch_failed:{date_code}"
+        lock_timeout = self.get_fetch_lock_ttl()
+        if not await self.temp_storage.acquire_lease(
+            lock_key, self.owner_id, lock_timeout
+        ):
+            logger.info(f"Waiting for another worker to fetch rates for {date_code}.")
+            deadline = asyncio.get_running_loop().time() + lock_timeout
+            while asyncio.get_running_loop().time() < deadline:
+                loaded, failed, locked = await self.temp_storage.get_many(
+                    [loaded_key, failed_key, lock_key]
+                )
+                if loaded or failed or not locked:
+                    return
+                await asyncio.sleep(self.config.rate_fetch_poll_interval)
+            return
+
+        try:
+            if await self.temp_storage.get_value(loaded_key):
+                return
+            logger.info(
+                f"Retrieving exchange rates for {date_code} from external service."
+            )
+            rates = await self.fetch_rates()
+            values = {
+                f"{date_code}{currency_code}": value
+                for currency_code, value in rates.items()
+            }
+            values[LAST_KNOWN_RATES_KEY] = json.dumps(
+                {"fetched_at": time(), "rates": rates}
+            )
+            values[loaded_key] = "1"
+            await self.temp_storage.save_many(values)
+            logger.info("Exchange rates retrieved and stored in temporary storage.")
+        except Exception as e:
+            if isinstance(e, httpx.HTTPError):
+                logger.error(f"HTTP error occurred while fetching exchange rate: {e}")
+            else:
+                logger.error(f"An error occurred while fetching exchange rate: {e}")
+            await self.temp_storage.save_key_value(
+                failed_key, "1", self.config.rate_fetch_failure_ttl
+            )
+        finally:
+            await self.temp_storage.release_lease(lock_key, self.owner_id)
+
+    def get_fetch_lock_ttl(self) -> int:
+        # The lock is held through every retry, so it has to outlive the slowest
+        # fetch: all attempts timing out plus the longest jittered backoffs.
+        attempts = self.config.rate_provider_retries + 1
+        attempt_timeout = (
+            self.config.rate_provider_connect_timeout
+            + self.config.rate_provider_read_timeout
+        )
+        backoff = sum(
+            self.config.rate_provider_backoff * 2**attempt * 1.5
+            for attempt in range(attempts - 1)
+        )
+        return self.config.rate_fetch_lock_timeout + math.ceil(
+            attempts * attempt_timeout + backoff
+        )
+
+    async def fetch_rates(self) -> dict[str, float]:
+        if monotonic() < self.circuit_open_until:
+            self.metrics.circuit_open_rejections += 1
+            raise RateProviderUnavailableException("Rate provider circuit is open")
+
+        retries = self.config.rate_provider_retries
+        for attempt in range(retries + 1):
+            started = monotonic()
+            try:
+                response = await self.client.get(self.config.currency_data_source)
+                response.raise_for_status()
+                data = response.json()
+                rates = {
+                    currency_code: float(currency_data["Value"])
+                    for currency_code, currency_data in data["Valute"].items()
+                }
+            except Exception as e:
+                self.record_fetch(started)
+                retryable = isinstance(e, httpx.TransportError) or (
+                    isinstance(e, httpx.HTTPStatusError)
+                    and e.response.status_code >= 500
+                )
+                if not retryable or attempt == retries:
+                    self.record_failure()
+                    raise
+                backoff = self.config.rate_provider_backoff * 2**attempt
+                logger.warning(
+                    f"Rate fetch attempt {attempt + 1} failed: {e!r}. "
+                    f"Retrying in {backoff:.2f} s."
+                )
+                await asyncio.sleep(backoff * random.uniform(0.5, 1.5))
+            else:
+                self.record_fetch(started)
+                self.consecutive_failures = 0
+                return rates
+
+    def record_fetch(self, started: float) -> None:
+        latency = monotonic() - started
+        self.metrics.fetches += 1
+        self.metrics.last_fetch_latency = latency
+        self.metrics.total_fetch_latency += latency
+
+    def record_failure(self) -> None:
+        self.metrics.fetch_failures += 1
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.config.rate_provider_failure_threshold:
+            self.circuit_open_until = (
+                monotonic() + self.config.rate_provider_circuit_reset_timeout
+            )
+            logger.error(
+                f"Rate provider failed {self.consecutive_failures} times in a row. "
+                f"Circuit opened for {self.config.rate_provider_circuit_reset_timeout} s."
+            )
+
+    def get_metrics(self) -> RateProviderMetrics:
+        return self.metrics.copy()
+
+    async def close(self) -> None:
+        await self.client.aclose()
@@ -0,0 +1,86 @@
+import asyncio
+import logging
+from typing import Optional
+
+from app.core.settings import Settings
+from app.schemas import PackageCreate
+from app.services.use_cases.abstract_repositories import DeltaAbstractRepository
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("package_service")
+
+
+class RegistrationBatcher:
+    def __init__(self, repository: DeltaAbstractRepository, config: Settings):
+        self.repository = repository
+        self.config = config
+        self.pending: list[tuple[PackageCreate, str, asyncio.Future]] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.writes: set[asyncio.Task] = set()
+
+    async def register(self, package_data: PackageCreate, user_id: str) -> int:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((package_data, user_id, future))
+        if len(self.pending) >= self.config.register_group_commit_max_batch:
+            self.start_write()
+        elif self.timer is None:
+            self.timer = loop.call_later(
+                self.config.register_group_commit_window, self.start_write
+            )
+        return await future
+
+    def start_write(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if batch:
+            write = asyncio.create_task(self.write_batch(batch))
+            self.writes.add(write)
+            write.add_done_callback(self.writes.discard)
+
+    async def write_batch(
+        self, batch: list[tuple[PackageCreate, str, asyncio.Future]]
+    ) -> None:
+        try:
+            package_ids = await self.repository.register_packages_for_users(
+                [(package_data, user_id) for package_data, user_id, _ in batch]
+            )
+        except Exception as e:
+            if len(batch) == 1:
+                self.set_exception(batch[0][2], e)
+                return
+            # One bad registration must not fail the others.
+            logger.warning(
+                "Group commit of %s packages failed, registering them one by one: %s",
+                len(batch),
+                e,
+            )
+            for package_data, user_id, future in batch:
+                try:
+                    response = await self.repository.register_package(
+                        package_data, user_id
+                    )
+                except Exception as error:
+                    self.set_exception(future, error)
+                else:
+                    self.set_result(future, response.id)
+            return
+        for (_, _, future), package_id in zip(batch, package_ids):
+            self.set_result(future, package_id)
+        logger.debug("Group commit of %s packages.", len(batch))
+
+    @staticmethod
+    def set_result(future: asyncio.Future, package_id: int) -> None:
+        if not future.done():
+            future.set_result(package_id)
+
+    @staticmethod
+    def set_exception(future: asyncio.Future, exception: Exception) -> None:
+        if not future.done():
+            future.set_exception(exception)
+
+    async def close(self) -> None:
+        self.start_write()
+        await asyncio.gather(*self.writes, return_exceptions=True)
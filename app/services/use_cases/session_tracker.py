@@ -0,0 +1,64 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from app.core.settings import Settings
+from app.services.use_cases.abstract_repositories import DeltaAbstractRepository
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("package_service")
+
+
+class SessionTracker:
+    def __init__(self, repository: DeltaAbstractRepository, config: Settings):
+        self.repository = repository
+        self.config = config
+        self.known_sessions: OrderedDict[str, None] = OrderedDict()
+        self.last_access: dict[str, datetime] = {}
+        self.flusher: Optional[asyncio.Task] = None
+
+    async def track(self, session_id: str) -> None:
+        accessed_at = datetime.now()
+        if session_id in self.known_sessions:
+            self.known_sessions.move_to_end(session_id)
+            self.last_access[session_id] = accessed_at
+            self.ensure_flusher()
+            return
+        await self.repository.upsert_users({session_id: accessed_at})
+        self.known_sessions[session_id] = None
+        while len(self.known_sessions) > self.config.known_sessions_cache_size:
+            self.known_sessions.popitem(last=False)
+
+    def ensure_flusher(self) -> None:
+        if self.flusher is None or self.flusher.done():
+            self.flusher = asyncio.create_task(self.run_flusher())
+
+    async def run_flusher(self) -> None:
+        while True:
+            await asyncio.sleep(self.config.last_access_flush_interval)
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not self.last_access:
+            return
+        last_access, self.last_access = self.last_access, {}
+        written = False
+        try:
+            await self.repository.upsert_users(last_access)
+            written = True
+            logger.info("Last access time written for %s sessions.", len(last_access))
+        except Exception as e:
+            logger.error(f"Error while writing last access times: {e}")
+        finally:
+            if not written:
+                for session_id, accessed_at in last_access.items():
+                    self.last_access.setdefault(session_id, accessed_at)
+
+    async def close(self) -> None:
+        if self.flusher is not None:
+            self.flusher.cancel()
+            await asyncio.gather(self.flusher, return_exceptions=True)
+            self.flusher = None
+        await self.flush()
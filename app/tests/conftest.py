@@ -1,5 +1,6 @@
 # pylint: disable=redefined-outer-name
 # pylint: disable=unused-argument
+import asyncio
 from os import environ
 from uuid import uuid4
 
@@ -16,6 +17,7 @@ from sqlalchemy.ext.asyncio import (
     create_async_engine,
 )
 from sqlalchemy_utils import create_database, database_exists, drop_database
+from starlette import status
 
 from app.core.containers import Container
 from app.core.settings import settings
@@ -121,3 +123,24 @@ def client(migrated_postgres, session_factory_async):
     )  # pylint: disable=no-member
     yield AsyncClient(app=app, base_url="http://test")
     app.container.unwire()  # pylint: disable=no-member
+
+
+@pytest.fixture
+def run_calculation(client):
+    """
+    Запускает расчет стоимости доставки и ждет завершения задачи.
+    """
+
+    async def wait(job: dict) -> dict:
+        while job["status"] in ("queued", "running"):
+            await asyncio.sleep(0.05)
+            response = await client.get(url=f"/calculation_jobs/{job['id']}")
+            job = response.json()
+        return job
+
+    async def run() -> dict:
+        response = await client.post(url="/run_calculation")
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        return await asyncio.wait_for(wait(response.json()), timeout=60)
+
+    return run
@@ -0,0 +1,245 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from app.core.settings import settings
+from app.infrastructure.buffered_log_sink import BufferedCalculationLogSink
+from app.infrastructure.utils import CalculationLogStorageUnavailableException
+from app.schemas import CalculationLogModel, PackageToCalc
+from app.services.use_cases.package_cost_calculator import PackageCostCalculator
+
+pytestmark = pytest.mark.asyncio
+
+
+class SlowLogRepository:
+    def __init__(self):
+        self.chunks = []
+        self.daily_totals = []
+
+    async def add_calc_data(self, calc_log_models):
+        await asyncio.sleep(0.01)
+        self.chunks.append([model.package_id for model in calc_log_models])
+        return calc_log_models
+
+    async def add_daily_totals(self, daily_totals):
+        self.daily_totals.extend(daily_totals)
+        return len(daily_totals)
+
+
+class FailingLogRepository(SlowLogRepository):
+    def __init__(self, failures: int):
+        super().__init__()
+        self.failures = failures
+        self.attempts = 0
+
+    async def add_calc_data(self, calc_log_models):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise CalculationLogStorageUnavailableException("mongo is down")
+        return await super().add_calc_data(calc_log_models)
+
+
+def make_logs(first_id: int, count: int) -> list[CalculationLogModel]:
+    return [
+        CalculationLogModel(
+            package_id=package_id,
+            package_type_id=1,
+            delivery_cost=1.0,
+            date=datetime.now(),
+        )
+        for package_id in range(first_id, first_id + count)
+    ]
+
+
+async def test_sink_writes_bounded_chunks_and_flushes():
+    repository = SlowLogRepository()
+    sink = BufferedCalculationLogSink(
+        repository,
+        settings.copy(
+            update={
+                "log_sink_chunk_size": 10,
+                "log_sink_max_buffered": 20,
+                "log_sink_flush_interval": 60,
+            }
+        ),
+    )
+    max_buffered = 0
+
+    for first_id in range(1, 101, 25):
+        await sink.add_calc_data(make_logs(first_id, 25))
+        max_buffered = max(max_buffered, len(sink.buffer))
+    await sink.flush()
+
+    written = [package_id for chunk in repository.chunks for package_id in chunk]
+    assert sorted(written) == list(range(1, 101))
+    assert all(len(chunk) <= 10 for chunk in repository.chunks)
+    assert max_buffered <= 30
+    metrics = sink.get_metrics()
+    assert metrics.docs_written == 100
+    assert metrics.buffered == 0
+    assert metrics.docs_per_second > 0
+    await sink.close()
+
+
+async def test_sink_flushes_partial_chunk_after_interval():
+    repository = SlowLogRepository()
+    sink = BufferedCalculationLogSink(
+        repository,
+        settings.copy(
+            update={"log_sink_chunk_size": 100, "log_sink_flush_interval": 0.05}
+        ),
+    )
+
+    await sink.add_calc_data(make_logs(1, 3))
+    await asyncio.sleep(0.2)
+
+    assert repository.chunks == [[1, 2, 3]]
+    await sink.close()
+
+
+async def test_sink_retries_and_blocks_producers_while_mongo_is_down():
+    repository = FailingLogRepository(failures=3)
+    sink = BufferedCalculationLogSink(
+        repository,
+        settings.copy(
+            update={
+                "log_sink_chunk_size": 10,
+                "log_sink_max_buffered": 20,
+                "log_sink_flush_interval": 60,
+                "log_sink_write_retries": 5,
+                "log_sink_retry_backoff": 0.05,
+            }
+        ),
+    )
+
+    producer = asyncio.create_task(sink.add_calc_data(make_logs(1, 40)))
+    await asyncio.sleep(0.1)
+    assert not producer.done()
+    assert len(sink.buffer) == 20
+
+    await producer
+    await sink.flush()
+
+    written = [package_id for chunk in repository.chunks for package_id in chunk]
+    assert sorted(written) == list(range(1, 41))
+    metrics = sink.get_metrics()
+    assert metrics.write_retries == 3
+    assert metrics.docs_failed == 0
+    await sink.close()
+
+
+async def test_sink_drops_chunk_after_retry_budget():
+    repository = FailingLogRepository(failures=2)
+    sink = BufferedCalculationLogSink(
+        repository,
+        settings.copy(
+            update={
+                "log_sink_chunk_size": 10,
+                "log_sink_write_retries": 1,
+                "log_sink_retry_backoff": 0.01,
+            }
+        ),
+    )
+
+    await sink.add_calc_data(make_logs(1, 10))
+    await sink.flush()
+    await sink.add_calc_data(make_logs(11, 10))
+    await sink.flush()
+
+    assert repository.chunks == [list(range(11, 21))]
+    metrics = sink.get_metrics()
+    assert (metrics.docs_failed, metrics.docs_written) == (10, 10)
+    assert metrics.buffered == 0
+    await sink.close()
+
+
+async def test_sink_does_not_retry_writes_that_may_have_been_applied():
+    class TimingOutLogRepository(SlowLogRepository):
+        attempts = 0
+
+        async def add_calc_data(self, calc_log_models):
+            self.attempts += 1
+            await super().add_calc_data(calc_log_models)
+            raise TimeoutError("no reply after the insert")
+
+    repository = TimingOutLogRepository()
+    sink = BufferedCalculationLogSink(
+        repository,
+        settings.copy(
+            update={"log_sink_chunk_size": 10, "log_sink_retry_backoff": 0.01}
+        ),
+    )
+
+    await sink.add_calc_data(make_logs(1, 10))
+    await sink.flush()
+
+    assert repository.attempts == 1
+    assert repository.chunks == [list(range(1, 11))]
+    metrics = sink.get_metrics()
+    assert (metrics.write_retries, metrics.docs_failed) == (0, 10)
+    await sink.close()
+
+
+async def test_batch_survives_mongo_failing_after_commit():
+    class CommittingRepository:
+        async def update_delivery_costs(self, packages_to_calc):
+            return len(packages_to_calc)
+
+    class NoopPackageCache:
+        async def invalidate(self, package_ids):
+            pass
+
+    class DownTemporaryStorage:
+        async def delete_key(self, key):
+            raise ConnectionError("redis is down")
+
+    class FlakyTotalsLogRepository(SlowLogRepository):
+        totals_attempts = 0
+
+        async def add_daily_totals(self, daily_totals):
+            self.totals_attempts += 1
+            if self.totals_attempts == 1:
+                raise CalculationLogStorageUnavailableException("mongo is down")
+            return await super().add_daily_totals(daily_totals)
+
+    log_repository = FlakyTotalsLogRepository()
+    config = settings.copy(
+        update={"log_sink_chunk_size": 10, "log_sink_retry_backoff": 0.01}
+    )
+    sink = BufferedCalculationLogSink(log_repository, config)
+    calculator = PackageCostCalculator(
+        repository=CommittingRepository(),
+        temp_storage=DownTemporaryStorage(),
+        log_repository=log_repository,
+        log_sink=sink,
+        package_queue=None,
+        rate_provider=None,
+        package_cache=NoopPackageCache(),
+        config=config,
+    )
+    packages = [
+        PackageToCalc(
+            id=package_id,
+            package_type_id=package_id % 2 + 1,
+            name=f"Package {package_id}",
+            weight=1.5,
+            content_value=100.0,
+            delivery_cost=None,
+        )
+        for package_id in range(1, 6)
+    ]
+
+    await calculator.calculate_batch(packages, rate=90.0)
+    await sink.flush()
+
+    assert calculator.packages_processed == 5
+    assert log_repository.chunks == [[1, 2, 3, 4, 5]]
+    assert log_repository.totals_attempts == 2
+    counts = {
+        total.package_type_id: total.count for total in log_repository.daily_totals
+    }
+    assert counts == {1: 2, 2: 3}
+    metrics = sink.get_metrics()
+    assert (metrics.write_retries, metrics.daily_totals_failed) == (1, 0)
+    await sink.close()
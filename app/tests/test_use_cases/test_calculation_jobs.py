@@ -0,0 +1,114 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.core.settings import settings
+from app.schemas import CalculationJobModel, CalculationJobStatus
+from app.services.use_cases.calculation_jobs import (
+    ACTIVE_JOB_KEY,
+    CalculationJobManager,
+)
+
+pytestmark = pytest.mark.asyncio
+
+
+class MemoryStorage:
+    def __init__(self):
+        self.values = {}
+        self.renewals = True
+
+    async def get_value(self, key):
+        value = self.values.get(key)
+        return value.encode("utf-8") if value is not None else None
+
+    async def save_key_value(self, key, value, expiration_time):
+        self.values[key] = value
+
+    async def acquire_lease(self, key, owner, expiration_time):
+        if key in self.values:
+            return False
+        self.values[key] = owner
+        return True
+
+    async def renew_lease(self, key, owner, expiration_time):
+        return self.renewals and self.values.get(key) == owner
+
+    async def release_lease(self, key, owner):
+        if self.values.get(key) == owner:
+            del self.values[key]
+
+
+class StoppableCalculator:
+    def __init__(self):
+        self.stop_requested = False
+        self.packages_processed = 0
+        self.finished = False
+
+    def request_stop(self):
+        self.stop_requested = True
+
+    async def calculate_delivery_cost(self):
+        while not self.stop_requested:
+            await asyncio.sleep(0.01)
+            self.packages_processed += 1
+        await asyncio.sleep(0.05)
+        self.finished = True
+
+
+def make_manager(storage, calculator) -> CalculationJobManager:
+    return CalculationJobManager(
+        calculator_factory=lambda: calculator,
+        temp_storage=storage,
+        config=settings.copy(
+            update={
+                "calculation_job_heartbeat_interval": 0.05,
+                "calculation_job_start_poll_interval": 0.01,
+            }
+        ),
+    )
+
+
+async def test_lost_lease_stops_calculation_before_release():
+    storage = MemoryStorage()
+    calculator = StoppableCalculator()
+    manager = make_manager(storage, calculator)
+
+    job = await manager.start_job()
+    storage.renewals = False
+    task, _ = manager.running[job.id]
+    await asyncio.wait_for(task, timeout=5)
+
+    assert calculator.stop_requested
+    assert calculator.finished
+    assert ACTIVE_JOB_KEY not in storage.values
+    failed_job = await manager.get_job(job.id)
+    assert failed_job.status == CalculationJobStatus.failed
+    assert failed_job.error == "Calculation job lost its lease"
+
+
+async def test_abandoned_job_is_not_returned_as_running():
+    storage = MemoryStorage()
+    calculator = StoppableCalculator()
+    manager = make_manager(storage, calculator)
+    abandoned_job = CalculationJobModel(
+        id="abandoned",
+        status=CalculationJobStatus.running,
+        created_at=datetime.now() - timedelta(hours=1),
+        heartbeat_at=datetime.now() - timedelta(hours=1),
+    )
+    storage.values[manager.get_job_key(abandoned_job.id)] = abandoned_job.json()
+    storage.values[ACTIVE_JOB_KEY] = abandoned_job.id
+
+    async def expire_lease():
+        await asyncio.sleep(0.05)
+        del storage.values[ACTIVE_JOB_KEY]
+
+    expiry = asyncio.create_task(expire_lease())
+    job = await manager.start_job()
+    await expiry
+
+    assert job.id != abandoned_job.id
+    assert job.status == CalculationJobStatus.queued
+    assert storage.values[ACTIVE_JOB_KEY] == job.id
+    await manager.shutdown()
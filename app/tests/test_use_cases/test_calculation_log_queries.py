@@ -0,0 +1,192 @@
+import json
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+import pytest_asyncio
+from starlette import status
+
+from app.core.settings import settings
+from app.infrastructure.mongo_client import MongoClient
+from app.services.use_cases.package_cost_calculator import (
+    compact_calculation_logs,
+    get_aggregated_data_cache_key,
+)
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest_asyncio.fixture
+async def log_repository(container) -> MongoClient:
+    log_repository = container.log_repository()
+    await log_repository.ensure_indexes()
+    return log_repository
+
+
+@pytest_asyncio.fixture
+async def temporary_log_repository() -> MongoClient:
+    log_repository = MongoClient(
+        settings.copy(
+            update={
+                "mongo_db": f"test_{uuid4().hex[:8]}",
+                "calculation_log_retention_days": 30,
+            }
+        )
+    )
+    yield log_repository
+    await log_repository.mongo.drop_database(log_repository.database.name)
+    log_repository.close()
+
+
+async def explain(log_repository: MongoClient, collection: str, pipeline: list) -> str:
+    plan = await log_repository.database.command(
+        "aggregate", collection, pipeline=pipeline, explain=True
+    )
+    return json.dumps(plan, default=str)
+
+
+async def test_range_pipeline_uses_rollup_index(log_repository):
+    today = datetime.now()
+    plan = await explain(
+        log_repository,
+        "daily_delivery_totals",
+        MongoClient.get_range_pipeline(today - timedelta(days=7), today),
+    )
+
+    assert "IXSCAN" in plan
+    assert "date_1_package_type_id_1" in plan
+    assert "COLLSCAN" not in plan
+
+
+async def test_daily_totals_pipeline_uses_compound_index(log_repository):
+    today = datetime.now()
+    plan = await explain(
+        log_repository,
+        "deliveries",
+        MongoClient.get_daily_totals_pipeline(today - timedelta(days=7), today),
+    )
+
+    assert "IXSCAN" in plan
+    assert "COLLSCAN" not in plan
+
+
+async def test_aggregated_data_range(client, log_repository, run_calculation):
+    package_data = {
+        "name": "Test Package",
+        "weight": 1.5,
+        "content_value": 100.0,
+        "type_id": 1
+    }
+    await client.post(
+        url="/packages/register",
+        json=package_data,
+        cookies={"session_id": '34447757-bc8f-447d-b7c8-960f7476c436'},
+    )
+    await run_calculation()
+
+    today = datetime.now()
+    response = await client.get(
+        url="/aggregated_data/range",
+        params={
+            "from": (today - timedelta(days=1)).isoformat(),
+            "to": today.isoformat(),
+        },
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    rows = response.json()
+    today_rows = [row for row in rows if row["date"] == today.strftime("%Y-%m-%d")]
+    assert today_rows
+    for row in today_rows:
+        assert row["delivery_cost_avg"] == pytest.approx(
+            row["delivery_cost_sum"] / row["count"]
+        )
+
+    response = await client.get(
+        url="/aggregated_data/range",
+        params={
+            "from": today.isoformat(),
+            "to": (today - timedelta(days=1)).isoformat(),
+        },
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+async def test_deliveries_is_timeseries_with_retention(temporary_log_repository):
+    await temporary_log_repository.ensure_indexes()
+
+    info = await temporary_log_repository.get_collection_info("deliveries")
+
+    assert info["type"] == "timeseries"
+    assert info["options"]["timeseries"]["timeField"] == "date"
+    assert info["options"]["timeseries"]["metaField"] == "package_type_id"
+    assert info["options"]["expireAfterSeconds"] == 30 * 24 * 60 * 60
+
+
+async def test_migrate_deliveries_to_timeseries(temporary_log_repository):
+    now = datetime.now()
+    old_day = now - timedelta(days=60)
+    await temporary_log_repository.deliveries.insert_many(
+        [
+            {"package_id": 1, "package_type_id": 1, "delivery_cost": 10.0, "date": now},
+            {"package_id": 2, "package_type_id": 1, "delivery_cost": 5.0, "date": now},
+            {
+                "package_id": 3,
+                "package_type_id": 2,
+                "delivery_cost": 7.0,
+                "date": old_day,
+            },
+        ]
+    )
+
+    migrated = await temporary_log_repository.migrate_deliveries_to_timeseries(
+        drop_legacy=True
+    )
+
+    assert migrated == 2
+    info = await temporary_log_repository.get_collection_info("deliveries")
+    assert info["type"] == "timeseries"
+    legacy = await temporary_log_repository.get_collection_info("deliveries_legacy")
+    assert legacy is None
+    assert await temporary_log_repository.deliveries.count_documents({}) == 2
+    totals = await temporary_log_repository.get_aggregated_data_range(old_day, now)
+    assert [(t.package_type_id, t.delivery_cost_sum, t.count) for t in totals] == [
+        (2, 7.0, 1),
+        (1, 15.0, 2),
+    ]
+
+
+async def test_compact_calculation_logs(container, temporary_log_repository):
+    await temporary_log_repository.ensure_indexes()
+    compacted_day = datetime.now() - timedelta(days=27)
+    await temporary_log_repository.deliveries.insert_one(
+        {
+            "package_id": 1,
+            "package_type_id": 1,
+            "delivery_cost": 10.0,
+            "date": compacted_day,
+        }
+    )
+
+    assert (
+        await compact_calculation_logs(
+            temporary_log_repository, container.redis_repository()
+        )
+        == 1
+    )
+    totals = await temporary_log_repository.get_aggregated_data(compacted_day)
+    assert [(t.package_type_id, t.delivery_cost_sum) for t in totals] == [(1, 10.0)]
+
+
+async def test_compaction_drops_cached_aggregated_data(
+    container, temporary_log_repository
+):
+    await temporary_log_repository.ensure_indexes()
+    first_day, _ = temporary_log_repository.get_compaction_window()
+    temp_storage = container.redis_repository()
+    cache_key = get_aggregated_data_cache_key(first_day)
+    await temp_storage.save_key_value(cache_key, "[]", 60)
+
+    await compact_calculation_logs(temporary_log_repository, temp_storage)
+
+    assert await temp_storage.get_value(cache_key) is None
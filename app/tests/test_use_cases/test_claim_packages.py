@@ -0,0 +1,67 @@
+import asyncio
+from collections import Counter
+
+import pytest
+from starlette import status
+
+from app.schemas import PackageCreate
+
+pytestmark = pytest.mark.asyncio
+
+USER_ID = "34447757-bc8f-447d-b7c8-960f7476c436"
+
+
+async def test_claim_packages(client, run_calculation):
+    cookies = {"session_id": USER_ID}
+    package = {
+        "name": "Test Package", "weight": 1.5, "content_value": 100.0, "type_id": 1
+    }
+    response = await client.post(
+        url="/packages/register_batch", json=[package] * 3, cookies=cookies
+    )
+    package_ids = [item["id"] for item in response.json()["items"]]
+
+    response = await client.post(url="/companies/7/claim", params={"limit": 2})
+    assert response.json() == []
+
+    await run_calculation()
+    response = await client.post(url="/companies/7/claim", params={"limit": 2})
+    assert response.status_code == status.HTTP_200_OK
+    assert [claimed["id"] for claimed in response.json()] == package_ids[:2]
+    assert response.json()[0]["package_type"] == {"id": 1, "name": "одежда"}
+
+    response = await client.post(url="/companies/8/claim", params={"limit": 2})
+    assert [claimed["id"] for claimed in response.json()] == package_ids[2:]
+
+    response = await client.post(
+        url=f"/assign_package/{package_ids[0]}", params={"company_id": 8}
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+async def test_concurrent_claimers_never_share_packages(container):
+    repository = container.repository()
+    package_ids = await repository.register_packages(
+        [
+            PackageCreate(
+                name=f"Package {number}", weight=1.5, content_value=100.0, type_id=1
+            )
+            for number in range(200)
+        ],
+        USER_ID,
+    )
+    packages_to_calc = await repository.get_packages_to_calc(0, len(package_ids))
+    for package in packages_to_calc:
+        package.delivery_cost = 1.0
+    await repository.update_delivery_costs(packages_to_calc)
+
+    async def claimer(company_id: int) -> list[int]:
+        claimed = []
+        while packages := await repository.claim_packages(company_id, 7):
+            claimed.extend(package.id for package in packages)
+        return claimed
+
+    claims = await asyncio.gather(*(claimer(company_id) for company_id in range(5)))
+
+    claimed = Counter(package_id for claim in claims for package_id in claim)
+    assert claimed == Counter(package_ids)
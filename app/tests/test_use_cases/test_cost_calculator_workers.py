@@ -0,0 +1,66 @@
+import asyncio
+from collections import Counter
+from datetime import datetime
+
+import pytest
+
+from app.core.settings import settings
+from app.schemas import PackageCreate
+from app.services.use_cases.package_cost_calculator import PackageCostCalculator
+
+pytestmark = pytest.mark.asyncio
+
+USER_ID = "34447757-bc8f-447d-b7c8-960f7476c436"
+
+
+async def test_workers_calculate_every_package_exactly_once(container):
+    repository = container.repository()
+    for number in range(1, 41):
+        await repository.register_package(
+            PackageCreate(
+                name=f"Package {number}", weight=1.5, content_value=100.0, type_id=1
+            ),
+            USER_ID,
+        )
+    worker_settings = settings.copy(
+        update={"calculation_lease_range_size": 5, "calculation_batch_size": 2}
+    )
+    workers = [
+        PackageCostCalculator(
+            repository=repository,
+            temp_storage=container.redis_repository(),
+            log_repository=container.log_repository(),
+            log_sink=container.log_sink(),
+            package_queue=container.package_queue(),
+            rate_provider=container.rate_provider(),
+            package_cache=container.package_cache(),
+            config=worker_settings,
+        )
+        for _ in range(4)
+    ]
+    started_at = datetime.now()
+
+    await asyncio.gather(*(worker.calculate_delivery_cost() for worker in workers))
+
+    assert await repository.get_pending_id_bounds() is None
+    logs = await container.log_repository().deliveries.find(
+        {"date": {"$gte": started_at}}, {"package_id": 1}
+    ).to_list(length=None)
+    calculations = Counter(log["package_id"] for log in logs)
+    assert calculations == Counter(range(1, 41))
+
+
+async def test_new_packages_calculated_from_stream(client, container):
+    response = await client.post(
+        url="/packages/register",
+        json={
+            "name": "Test Package", "weight": 1.5, "content_value": 100.0, "type_id": 1
+        },
+        cookies={"session_id": USER_ID},
+    )
+    package_id = response.json()["id"]
+
+    await container.cost_calculator().calculate_new_packages()
+
+    package = await container.repository().get_package(USER_ID, package_id)
+    assert package.delivery_cost > 0
@@ -0,0 +1,123 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from app.schemas import CalculationLogModel, PackageToCalc
+from app.services.use_cases.delivery_cost_kernel import (
+    aggregate_calculation_logs,
+    aggregate_daily_totals,
+    build_calculation_logs,
+    calculate_delivery_costs,
+    PackageColumns,
+)
+
+
+def scalar_delivery_cost(package: PackageToCalc, rate: float) -> float:
+    return (package.weight * 0.5 + package.content_value * 0.01) * rate
+
+
+@pytest.mark.parametrize("rate", [1.0, 92.5058, 0.0137])
+def test_vectorized_costs_match_scalar_formula(rate):
+    generator = np.random.default_rng(42)
+    packages = [
+        PackageToCalc(
+            id=package_id,
+            package_type_id=int(generator.integers(1, 4)),
+            name=f"Package {package_id}",
+            weight=float(generator.uniform(0.01, 500)),
+            content_value=float(generator.uniform(0.01, 100000)),
+            delivery_cost=None,
+        )
+        for package_id in range(1, 1001)
+    ]
+
+    columns = PackageColumns.from_packages(packages)
+    delivery_costs = calculate_delivery_costs(
+        columns.weights, columns.content_values, rate
+    )
+
+    assert delivery_costs.tolist() == [
+        scalar_delivery_cost(package, rate) for package in packages
+    ]
+
+
+def test_calculation_logs_built_from_columns():
+    packages = [
+        PackageToCalc(
+            id=7, package_type_id=2, name="a", weight=1.5, content_value=100.0,
+            delivery_cost=None,
+        ),
+        PackageToCalc(
+            id=9, package_type_id=3, name="b", weight=2.0, content_value=10.0,
+            delivery_cost=None,
+        ),
+    ]
+    date = datetime(2023, 11, 27, 12, 0)
+
+    columns = PackageColumns.from_packages(packages)
+    delivery_costs = calculate_delivery_costs(
+        columns.weights, columns.content_values, 2.0
+    )
+    logs = build_calculation_logs(columns, delivery_costs, date)
+
+    assert [log.dict() for log in logs] == [
+        {"package_id": 7, "package_type_id": 2, "delivery_cost": 3.5, "date": date},
+        {"package_id": 9, "package_type_id": 3, "delivery_cost": 2.2, "date": date},
+    ]
+
+
+def test_daily_totals_aggregated_per_package_type():
+    type_ids = np.array([3, 1, 3, 1, 2], dtype=np.int64)
+    delivery_costs = np.array([1.0, 2.0, 4.0, 0.5, 7.0])
+
+    totals = aggregate_daily_totals(
+        type_ids, delivery_costs, datetime(2023, 11, 27, 12, 0)
+    )
+
+    assert [total.dict() for total in totals] == [
+        {
+            "date": "2023-11-27",
+            "package_type_id": 1,
+            "delivery_cost_sum": 2.5,
+            "count": 2,
+            "delivery_cost_min": 0.5,
+            "delivery_cost_max": 2.0,
+        },
+        {
+            "date": "2023-11-27",
+            "package_type_id": 2,
+            "delivery_cost_sum": 7.0,
+            "count": 1,
+            "delivery_cost_min": 7.0,
+            "delivery_cost_max": 7.0,
+        },
+        {
+            "date": "2023-11-27",
+            "package_type_id": 3,
+            "delivery_cost_sum": 5.0,
+            "count": 2,
+            "delivery_cost_min": 1.0,
+            "delivery_cost_max": 4.0,
+        },
+    ]
+
+
+def test_daily_totals_aggregated_from_logs_per_day():
+    logs = [
+        CalculationLogModel(
+            package_id=package_id, package_type_id=1, delivery_cost=cost, date=date
+        )
+        for package_id, cost, date in [
+            (1, 2.0, datetime(2023, 11, 27, 23, 59)),
+            (2, 3.0, datetime(2023, 11, 28, 0, 1)),
+            (3, 1.0, datetime(2023, 11, 27, 12, 0)),
+        ]
+    ]
+
+    totals = aggregate_calculation_logs(logs)
+
+    assert [(total.date, total.count, total.delivery_cost_sum) for total in totals] == [
+        ("2023-11-27", 2, 3.0),
+        ("2023-11-28", 1, 3.0),
+    ]
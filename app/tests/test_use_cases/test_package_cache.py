@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+from starlette import status
+
+from app.core.settings import settings
+from app.schemas import PackageCreate
+from app.services.use_cases.package_cache import PackageCache
+
+pytestmark = pytest.mark.asyncio
+
+USER_ID = "34447757-bc8f-447d-b7c8-960f7476c436"
+OTHER_USER_ID = "35cc6b42-55fe-43f0-a8a2-a8ac7105616f"
+
+
+class CountingRepository:
+    def __init__(self, repository):
+        self.repository = repository
+        self.loads = 0
+
+    async def get_package_entry(self, package_id):
+        self.loads += 1
+        await asyncio.sleep(0.05)
+        return await self.repository.get_package_entry(package_id)
+
+
+async def register_package(repository) -> int:
+    response = await repository.register_package(
+        PackageCreate(name="Package", weight=1.5, content_value=100.0, type_id=1),
+        USER_ID,
+    )
+    return response.id
+
+
+async def test_concurrent_misses_share_one_load(container):
+    repository = CountingRepository(container.repository())
+    package_id = await register_package(repository.repository)
+    package_cache = PackageCache(repository, container.redis_repository(), settings)
+
+    packages = await asyncio.gather(
+        *(package_cache.get_package(USER_ID, package_id) for _ in range(10))
+    )
+
+    assert repository.loads == 1
+    assert {package.id for package in packages} == {package_id}
+    assert await package_cache.get_package(USER_ID, package_id) == packages[0]
+    assert await package_cache.get_package(OTHER_USER_ID, package_id) is None
+    assert repository.loads == 1
+    metrics = package_cache.get_metrics()
+    assert (metrics.hits, metrics.misses, metrics.coalesced) == (2, 10, 9)
+    assert metrics.hit_ratio == pytest.approx(2 / 12)
+
+
+async def test_stale_entries_are_not_written_back(container):
+    repository = container.repository()
+    temp_storage = container.redis_repository()
+    package_id = await register_package(repository)
+    package_cache = PackageCache(repository, temp_storage, settings)
+    cache_key = package_cache.get_cache_key(package_id)
+    stale_entry = await repository.get_package_entry(package_id)
+
+    await repository.assign_package(package_id, 1)
+    await package_cache.invalidate([package_id])
+    assert not await temp_storage.save_if_newer(
+        cache_key, stale_entry.json(), stale_entry.version, 60
+    )
+
+    await temp_storage.delete_key(cache_key)
+    fresh_entry = await repository.get_package_entry(package_id)
+    assert fresh_entry.version == stale_entry.version + 1
+    assert await temp_storage.save_if_newer(
+        cache_key, fresh_entry.json(), fresh_entry.version, 60
+    )
+    assert not await temp_storage.save_if_newer(
+        cache_key, stale_entry.json(), stale_entry.version, 60
+    )
+
+
+async def test_slow_load_is_not_written_back_after_tombstone_expires(container):
+    class SlowRepository:
+        def __init__(self, repository):
+            self.repository = repository
+
+        async def get_package_entry(self, package_id):
+            entry = await self.repository.get_package_entry(package_id)
+            await asyncio.sleep(1.5)
+            return entry
+
+    repository = container.repository()
+    temp_storage = container.redis_repository()
+    package_id = await register_package(repository)
+    package_cache = PackageCache(
+        SlowRepository(repository),
+        temp_storage,
+        settings.copy(
+            update={
+                "package_cache_tombstone_ttl": 1,
+                "package_cache_load_timeout": 0.5,
+            }
+        ),
+    )
+
+    load = asyncio.create_task(package_cache.get_package(USER_ID, package_id))
+    await asyncio.sleep(0.1)
+    await repository.assign_package(package_id, 1)
+    await package_cache.invalidate([package_id])
+    stale_package = await load
+
+    assert stale_package.id == package_id
+    assert await temp_storage.get_value(package_cache.get_cache_key(package_id)) is None
+    assert package_cache.get_metrics().stale_writes_skipped == 1
+
+
+async def test_calculation_invalidates_cached_package(client, run_calculation):
+    cookies = {"session_id": USER_ID}
+    package_data = {
+        "name": "Test Package",
+        "weight": 1.5,
+        "content_value": 100.0,
+        "type_id": 1,
+    }
+    response = await client.post(
+        url="/packages/register", json=package_data, cookies=cookies
+    )
+    package_id = response.json()["id"]
+    response = await client.get(url=f"/packages/{package_id}", cookies=cookies)
+    assert response.json()["delivery_cost"] == "Не рассчитано"
+
+    await run_calculation()
+
+    response = await client.get(url=f"/packages/{package_id}", cookies=cookies)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["delivery_cost"] > 0
+    response = await client.get(url="/package_cache/metrics")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["invalidations"] >= 1
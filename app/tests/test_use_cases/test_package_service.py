@@ -1,8 +1,13 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 
 import pytest
+from sqlalchemy import event
 from starlette import status
 
+from app.core.settings import settings
+from app.infrastructure.redis_temporary_storage import RedisTemporaryStorage
+from app.schemas import CalculationJobModel, CalculationJobStatus, PackageCreate
+
 pytestmark = pytest.mark.asyncio
 
 
@@ -35,6 +40,74 @@ async def test_register_package_variants(client, cookies, package_data):
     assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
 
 
+async def test_register_batch(client):
+    cookies = {"session_id": '34447757-bc8f-447d-b7c8-960f7476c436'}
+    packages = [
+        {"name": "First", "weight": 1.5, "content_value": 100.0, "type_id": 1},
+        {"name": "No weight", "content_value": 100.0, "type_id": 1},
+        {"name": "Unknown type", "weight": 1.5, "content_value": 100.0, "type_id": 99},
+        {"name": "Second", "weight": 2.5, "content_value": 10.0, "type_id": 2},
+    ]
+
+    response = await client.post(
+        url="/packages/register_batch", json=packages, cookies=cookies
+    )
+    assert response.status_code == status.HTTP_200_OK
+    batch = response.json()
+    assert batch["registered"] == 2
+    assert batch["failed"] == 2
+    assert [item["index"] for item in batch["items"]] == [0, 1, 2, 3]
+    assert batch["items"][1]["errors"][0]["loc"] == ["weight"]
+    assert batch["items"][2]["errors"][0]["loc"] == ["type_id"]
+    first_id, second_id = batch["items"][0]["id"], batch["items"][3]["id"]
+
+    response = await client.get(url=f"/packages/{first_id}", cookies=cookies)
+    assert response.json()["name"] == "First"
+    response = await client.get(url=f"/packages/{second_id}", cookies=cookies)
+    assert response.json()["name"] == "Second"
+    assert response.json()["package_type"]["id"] == 2
+
+
+@pytest.mark.parametrize("ids_match", [True, False])
+async def test_register_packages_with_auto_increment_increment(
+    container, engine_async, monkeypatch, ids_match
+):
+    def set_increment(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("SET SESSION auto_increment_increment = 3")
+        cursor.close()
+
+    await engine_async.dispose()
+    event.listen(engine_async.sync_engine, "connect", set_increment)
+    repository = container.repository()
+    if not ids_match:
+        # Stands in for ids InnoDB did not hand out as guessed.
+        async def inserted_rows_match(*args):
+            return False
+
+        monkeypatch.setattr(repository, "inserted_rows_match", inserted_rows_match)
+    packages = [
+        PackageCreate(
+            name=f"Package {number}", weight=1.5, content_value=100.0, type_id=1
+        )
+        for number in range(5)
+    ]
+    try:
+        package_ids = await repository.register_packages(
+            packages, '34447757-bc8f-447d-b7c8-960f7476c436'
+        )
+    finally:
+        event.remove(engine_async.sync_engine, "connect", set_increment)
+        await engine_async.dispose()
+
+    assert len(set(package_ids)) == 5
+    for number, package_id in enumerate(package_ids):
+        package = await repository.get_package(
+            '34447757-bc8f-447d-b7c8-960f7476c436', package_id
+        )
+        assert package.name == f"Package {number}"
+
+
 async def test_package_types(client):
     response = await client.get(
         url="/package-types",
@@ -45,6 +118,21 @@ async def test_package_types(client):
     assert response.json() == expected_data
 
 
+async def test_package_types_not_modified(client):
+    response = await client.get(url="/package-types")
+    assert response.status_code == status.HTTP_200_OK
+    etag = response.headers["etag"]
+
+    response = await client.get(url="/package-types", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.headers["etag"] == etag
+    assert response.content == b""
+
+    response = await client.get(url="/package-types", headers={"If-None-Match": '"stale"'})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["etag"] == etag
+
+
 async def test_my_package(client):
     package_data = {
         "name": "Test Package",
@@ -73,7 +161,8 @@ async def test_my_package(client):
                 "id": 1,
                 "name": "одежда"
             }
-        }]
+        }],
+        "next_cursor": None
     }
     response = await client.get(url="/my-packages", cookies={"session_id": '34447757-bc8f-447d-b7c8-960f7476c436'})
     assert response.status_code == status.HTTP_200_OK
@@ -83,7 +172,8 @@ async def test_my_package(client):
         "page": 1,
         "page_size": 10,
         "total_items": 0,
-        "data": []
+        "data": [],
+        "next_cursor": None
     }
 
     response = await client.get(url="/my-packages", cookies={"session_id": '35cc6b42-55fe-43f0-a8a2-a8ac7105616f'})
@@ -91,6 +181,67 @@ async def test_my_package(client):
     assert response.json() == expected_data
 
 
+async def test_my_packages_cursor(client):
+    cookies = {"session_id": '34447757-bc8f-447d-b7c8-960f7476c436'}
+    for number in range(5):
+        await client.post(
+            url="/packages/register",
+            json={
+                "name": f"Package {number}",
+                "weight": 1.5,
+                "content_value": 100.0,
+                "type_id": 1
+            },
+            cookies=cookies,
+        )
+
+    names = []
+    params = {"limit": 2, "with_total": False}
+    while True:
+        response = await client.get(url="/my-packages", params=params, cookies=cookies)
+        assert response.status_code == status.HTTP_200_OK
+        page = response.json()
+        assert page["total_items"] is None
+        names.extend(package["name"] for package in page["data"])
+        if page["next_cursor"] is None:
+            break
+        params["after"] = page["next_cursor"]
+
+    assert names == [f"Package {number}" for number in range(5)]
+
+    response = await client.get(url="/my-packages", params={"limit": 2}, cookies=cookies)
+    assert response.json()["total_items"] == 5
+    assert response.json()["page"] == 1
+
+
+async def test_my_packages_count_without_redis(client, monkeypatch):
+    cookies = {"session_id": '34447757-bc8f-447d-b7c8-960f7476c436'}
+    await client.post(
+        url="/packages/register",
+        json={"name": "Test Package", "weight": 1.5, "content_value": 100.0, "type_id": 1},
+        cookies=cookies,
+    )
+
+    async def redis_down(*args, **kwargs):
+        raise ConnectionError("redis is down")
+
+    monkeypatch.setattr(RedisTemporaryStorage, "get_value", redis_down)
+    monkeypatch.setattr(RedisTemporaryStorage, "save_key_value", redis_down)
+
+    response = await client.get(url="/my-packages", cookies=cookies)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["total_items"] == 1
+
+    response = await client.get(
+        url="/my-packages", params={"after": "not-a-cursor"}, cookies=cookies
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    for params in ({"limit": 0}, {"limit": -1}, {"limit": 1001}, {"offset": -1}):
+        response = await client.get(url="/my-packages", params=params, cookies=cookies)
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
 async def test_get_package(client):
     package_data = {
         "name": "Test Package",
@@ -124,6 +275,44 @@ async def test_get_package(client):
     assert response.json() == expected_data
 
 
+async def test_get_packages(client):
+    cookies = {"session_id": '34447757-bc8f-447d-b7c8-960f7476c436'}
+    package = {"name": "Test Package", "weight": 1.5, "content_value": 100.0, "type_id": 2}
+    response = await client.post(
+        url="/packages/register_batch", json=[package] * 2, cookies=cookies
+    )
+    first_id, second_id = [item["id"] for item in response.json()["items"]]
+    await client.post(
+        url="/packages/register",
+        json=package,
+        cookies={"session_id": '35cc6b42-55fe-43f0-a8a2-a8ac7105616f'},
+    )
+    foreign_id = second_id + 1
+
+    response = await client.get(
+        url="/packages",
+        params={"ids": f"{second_id},999,{foreign_id},{first_id}"},
+        cookies=cookies,
+    )
+    assert response.status_code == status.HTTP_200_OK
+    results = response.json()
+    assert [(result["id"], result["found"]) for result in results] == [
+        (second_id, True), (999, False), (foreign_id, False), (first_id, True)
+    ]
+    assert results[0]["package"]["package_type"] == {"id": 2, "name": "электроника"}
+    assert results[1]["package"] is None
+
+    response = await client.post(
+        url="/packages/lookup", json={"ids": [first_id, 999]}, cookies=cookies
+    )
+    assert [(result["id"], result["found"]) for result in response.json()] == [
+        (first_id, True), (999, False)
+    ]
+
+    response = await client.get(url="/packages", params={"ids": "1,x"}, cookies=cookies)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
 async def test_get_package_different_session(client):
     package_data = {
         "name": "Test Package",
@@ -145,7 +334,7 @@ async def test_get_package_different_session(client):
     assert response.status_code == status.HTTP_404_NOT_FOUND
 
 
-async def test_calculation(client):
+async def test_calculation(client, run_calculation):
     package_data = {
         "name": "Test Package",
         "weight": 1.5,
@@ -159,9 +348,7 @@ async def test_calculation(client):
         cookies={"session_id": '34447757-bc8f-447d-b7c8-960f7476c436'},
     )
 
-    await client.post(
-        url="/run_calculation",
-    )
+    await run_calculation()
 
     response = await client.get(
         url="/packages/1",
@@ -171,7 +358,7 @@ async def test_calculation(client):
     assert response.json()['delivery_cost'] > 0
 
 
-async def test_aggregated_data(client):
+async def test_aggregated_data(client, run_calculation):
     package_data = {
         "name": "Test Package",
         "weight": 1.5,
@@ -185,10 +372,177 @@ async def test_aggregated_data(client):
         cookies={"session_id": '34447757-bc8f-447d-b7c8-960f7476c436'},
     )
 
-    await client.post(
-        url="/run_calculation",
-    )
+    await run_calculation()
     current_date = datetime.now().isoformat()
     response = await client.get(url="/aggregated_data", params={"date": current_date})
     assert response.status_code == status.HTTP_200_OK
     assert len(response.json()) > 0
+
+
+async def test_calculation_job_status(client, run_calculation):
+    package_data = {
+        "name": "Test Package",
+        "weight": 1.5,
+        "content_value": 100.0,
+        "type_id": 1
+    }
+
+    await client.post(
+        url="/packages/register",
+        json=package_data,
+        cookies={"session_id": '34447757-bc8f-447d-b7c8-960f7476c436'},
+    )
+
+    job = await run_calculation()
+    assert job["status"] == "completed"
+    assert job["packages_processed"] == 1
+    assert job["error"] is None
+
+    response = await client.get(url="/calculation_jobs/unknown")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+async def test_abandoned_calculation_job_is_failed(container):
+    calculation_jobs = container.calculation_jobs()
+    job = CalculationJobModel(
+        id="abandoned",
+        status=CalculationJobStatus.running,
+        created_at=datetime.now() - timedelta(hours=1),
+    )
+    await calculation_jobs.save_job(job)
+    assert (await calculation_jobs.get_job(job.id)).status == "running"
+
+    job.heartbeat_at = datetime.now() - timedelta(
+        seconds=settings.calculation_job_lock_ttl + 1
+    )
+    await container.redis_repository().save_key_value(
+        calculation_jobs.get_job_key(job.id), job.json(), 60
+    )
+    abandoned_job = await calculation_jobs.get_job(job.id)
+    assert abandoned_job.status == "failed"
+    assert abandoned_job.error is not None
+
+
+async def test_rebuild_daily_totals(client, container, run_calculation):
+    package_data = {
+        "name": "Test Package",
+        "weight": 1.5,
+        "content_value": 100.0,
+        "type_id": 1
+    }
+
+    await client.post(
+        url="/packages/register",
+        json=package_data,
+        cookies={"session_id": '34447757-bc8f-447d-b7c8-960f7476c436'},
+    )
+
+    await run_calculation()
+    today = datetime.now()
+    log_repository = container.log_repository()
+    await log_repository.ensure_indexes()
+    raw_count = await log_repository.deliveries.count_documents({
+        "date": {"$gte": datetime(today.year, today.month, today.day)}
+    })
+
+    assert await log_repository.rebuild_daily_totals(today, today) > 0
+    totals = await log_repository.daily_totals.find(
+        {"date": today.strftime("%Y-%m-%d")}
+    ).to_list(length=None)
+    assert sum(total["count"] for total in totals) == raw_count
+
+
+async def test_aggregated_data_cache(client, container, run_calculation):
+    today = datetime.now()
+    await container.redis_repository().delete_key(
+        f"aggregated_data:{today.strftime('%Y-%m-%d')}"
+    )
+
+    response = await client.get(url="/aggregated_data", params={"date": today.isoformat()})
+    assert response.headers["X-Cache"] == "MISS"
+    response = await client.get(url="/aggregated_data", params={"date": today.isoformat()})
+    assert response.headers["X-Cache"] == "HIT"
+
+    package_data = {
+        "name": "Test Package",
+        "weight": 1.5,
+        "content_value": 100.0,
+        "type_id": 1
+    }
+    await client.post(
+        url="/packages/register",
+        json=package_data,
+        cookies={"session_id": '34447757-bc8f-447d-b7c8-960f7476c436'},
+    )
+    await run_calculation()
+
+    response = await client.get(url="/aggregated_data", params={"date": today.isoformat()})
+    assert response.headers["X-Cache"] == "MISS"
+    assert len(response.json()) > 0
+
+
+async def test_aggregated_data_without_redis(client, monkeypatch):
+    async def redis_down(*args, **kwargs):
+        raise ConnectionError("redis is down")
+
+    monkeypatch.setattr(RedisTemporaryStorage, "get_value", redis_down)
+    monkeypatch.setattr(RedisTemporaryStorage, "save_key_value", redis_down)
+
+    response = await client.get(
+        url="/aggregated_data", params={"date": datetime.now().isoformat()}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["X-Cache"] == "MISS"
+
+
+async def test_assign_package(client):
+    cookies = {"session_id": '34447757-bc8f-447d-b7c8-960f7476c436'}
+    response = await client.post(
+        url="/packages/register",
+        json={"name": "Test Package", "weight": 1.5, "content_value": 100.0, "type_id": 1},
+        cookies=cookies,
+    )
+    package_id = response.json()["id"]
+
+    response = await client.post(
+        url=f"/assign_package/{package_id}", params={"company_id": 7}
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+    response = await client.post(
+        url=f"/assign_package/{package_id}", params={"company_id": 8}
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = await client.post(url="/assign_package/999", params={"company_id": 8})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+async def test_assign_packages(client):
+    cookies = {"session_id": '34447757-bc8f-447d-b7c8-960f7476c436'}
+    package = {"name": "Test Package", "weight": 1.5, "content_value": 100.0, "type_id": 1}
+    response = await client.post(
+        url="/packages/register_batch", json=[package] * 3, cookies=cookies
+    )
+    first_id, second_id, third_id = [item["id"] for item in response.json()["items"]]
+    await client.post(url=f"/assign_package/{second_id}", params={"company_id": 8})
+
+    response = await client.post(
+        url="/assign_packages",
+        json={
+            "company_id": 7,
+            "package_ids": [third_id, 999, second_id, first_id, third_id],
+        },
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [
+        {"package_id": third_id, "status": "assigned"},
+        {"package_id": 999, "status": "not_found"},
+        {"package_id": second_id, "status": "already_assigned"},
+        {"package_id": first_id, "status": "assigned"},
+    ]
+
+    response = await client.post(
+        url="/assign_packages", json={"company_id": 8, "package_ids": [first_id]}
+    )
+    assert response.json() == [{"package_id": first_id, "status": "already_assigned"}]
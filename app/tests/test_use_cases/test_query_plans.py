@@ -0,0 +1,118 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy import event, insert, text
+
+from app.infrastructure.models import Package, User
+from app.schemas import PackageToCalc
+
+pytestmark = pytest.mark.asyncio
+
+USER_ID = "34447757-bc8f-447d-b7c8-960f7476c436"
+BULK_USER_ID = "9d0b3c52-7a0e-4f5e-a9a5-5d1e0c6f1b2a"
+FULL_SCAN_TYPES = {"ALL", "index"}
+
+QUERIES = {
+    "my_packages_offset": lambda r: r.get_my_packages(USER_ID, None, None, 100, 10),
+    "my_packages_cursor": lambda r: r.get_my_packages(USER_ID, None, None, 0, 10, 150),
+    "my_packages_by_type": lambda r: r.get_my_packages(USER_ID, 2, None, 0, 10),
+    "my_packages_not_calculated": lambda r: r.get_my_packages(
+        USER_ID, None, False, 0, 10
+    ),
+    "my_packages_calculated": lambda r: r.get_my_packages(USER_ID, None, True, 0, 10),
+    "count_my_packages": lambda r: r.count_my_packages(USER_ID, 2, False),
+    "get_package": lambda r: r.get_package(USER_ID, 1),
+    "get_package_entry": lambda r: r.get_package_entry(1),
+    "get_packages": lambda r: r.get_packages(USER_ID, [1, 2, 5, 4000]),
+    "claim_packages": lambda r: r.claim_packages(7, 10),
+    "pending_id_bounds": lambda r: r.get_pending_id_bounds(),
+    "packages_to_calc": lambda r: r.get_packages_to_calc(0, 100),
+    "packages_to_calc_by_ids": lambda r: r.get_packages_to_calc_by_ids([3, 6, 9]),
+    "update_delivery_costs": lambda r: r.update_delivery_costs(
+        [
+            PackageToCalc(
+                id=package_id,
+                package_type_id=1,
+                name="Package",
+                weight=1.0,
+                content_value=1.0,
+                delivery_cost=1.0,
+            )
+            for package_id in (3, 6, 9)
+        ]
+    ),
+}
+
+
+@pytest_asyncio.fixture
+async def repository(container, session_factory_async):
+    packages = [
+        {
+            "name": f"Package {number}",
+            "weight": 1.5,
+            "content_value": 100.0,
+            "type_id": number % 3 + 1,
+            "user_id": USER_ID,
+            "delivery_cost": None if number % 3 == 0 else 10.0,
+            "company_id": None,
+        }
+        for number in range(300)
+    ] + [
+        {
+            "name": f"Bulk package {number}",
+            "weight": 1.5,
+            "content_value": 100.0,
+            "type_id": number % 3 + 1,
+            "user_id": BULK_USER_ID,
+            "delivery_cost": None if number % 50 == 0 else 10.0,
+            "company_id": None if number % 20 == 0 else 1,
+        }
+        for number in range(5000)
+    ]
+    async with session_factory_async() as session:
+        async with session.begin():
+            session.add(User(id=BULK_USER_ID))
+            await session.flush()
+            await session.execute(insert(Package), packages)
+        await session.execute(text("ANALYZE TABLE packages"))
+    return container.repository()
+
+
+@pytest.fixture
+def captured_statements(repository, engine_async):
+    statements = []
+
+    def capture(connection, cursor, statement, parameters, context, executemany):
+        if "packages" in statement and statement.lstrip().startswith(
+            ("SELECT", "UPDATE")
+        ):
+            statements.append((statement, parameters))
+
+    event.listen(engine_async.sync_engine, "before_cursor_execute", capture)
+    yield statements
+    event.remove(engine_async.sync_engine, "before_cursor_execute", capture)
+
+
+async def explain(engine_async, statement: str, parameters) -> list[dict]:
+    async with engine_async.connect() as connection:
+        result = await connection.exec_driver_sql(f"EXPLAIN {statement}", parameters)
+        return [dict(row) for row in result.mappings()]
+
+
+@pytest.mark.parametrize("query", QUERIES.values(), ids=QUERIES.keys())
+async def test_query_uses_index(query, repository, captured_statements, engine_async):
+    await query(repository)
+
+    assert captured_statements
+    for statement, parameters in captured_statements:
+        plan = await explain(engine_async, statement, parameters)
+        package_rows = [
+            row for row in plan if (row["table"] or "").startswith("packages")
+        ]
+        if not package_rows:
+            # MIN/MAX answered from the index alone.
+            assert any(
+                "Select tables optimized away" in (row["Extra"] or "") for row in plan
+            ), plan
+        for row in package_rows:
+            assert row["type"] not in FULL_SCAN_TYPES, (statement, row)
+            assert row["key"] is not None, (statement, row)
@@ -0,0 +1,204 @@
+import asyncio
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+import pytest
+import pytest_asyncio
+
+from app.core.settings import settings
+from app.infrastructure.utils import RateProviderUnavailableException
+from app.services.use_cases.rate_provider import LAST_KNOWN_RATES_KEY, RateProvider
+
+pytestmark = pytest.mark.asyncio
+
+RATES_RESPONSE = {"Valute": {"USD": {"Value": 90.5}, "EUR": {"Value": 98.25}}}
+
+
+class StubRateHandler(BaseHTTPRequestHandler):
+    statuses: list[int] = []
+    requests = 0
+
+    def do_GET(self):
+        StubRateHandler.requests += 1
+        status = self.statuses.pop(0) if self.statuses else 200
+        body = json.dumps(RATES_RESPONSE).encode() if status == 200 else b"error"
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    StubRateHandler.statuses = []
+    StubRateHandler.requests = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubRateHandler)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/daily_json.js"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest_asyncio.fixture
+async def rate_keys(container):
+    date_code = RateProvider.get_date_code()
+    keys = [
+        f"{date_code}USD",
+        f"{date_code}EUR",
+        f"rates_loaded:{date_code}",
+        f"rate_fetch_failed:{date_code}",
+        LAST_KNOWN_RATES_KEY,
+    ]
+    storage = container.redis_repository()
+    for key in keys:
+        await storage.delete_key(key)
+    yield keys
+    for key in keys:
+        await storage.delete_key(key)
+
+
+def make_provider(container, stub_server, **overrides) -> RateProvider:
+    config = settings.copy(
+        update={
+            "currency_data_source": stub_server,
+            "rate_provider_backoff": 0.01,
+            **overrides,
+        }
+    )
+    return RateProvider(temp_storage=container.redis_repository(), config=config)
+
+
+async def test_fetch_retries_server_errors(container, stub_server):
+    StubRateHandler.statuses = [500, 503]
+    provider = make_provider(container, stub_server)
+
+    assert await provider.fetch_rates() == {"USD": 90.5, "EUR": 98.25}
+    assert StubRateHandler.requests == 3
+    metrics = provider.get_metrics()
+    assert metrics.fetches == 3
+    assert metrics.fetch_failures == 0
+    assert metrics.last_fetch_latency > 0
+    await provider.close()
+
+
+async def test_circuit_opens_after_repeated_failures(container, stub_server):
+    StubRateHandler.statuses = [500] * 10
+    provider = make_provider(
+        container,
+        stub_server,
+        rate_provider_retries=0,
+        rate_provider_failure_threshold=2,
+    )
+
+    for _ in range(2):
+        with pytest.raises(Exception):
+            await provider.fetch_rates()
+    with pytest.raises(RateProviderUnavailableException):
+        await provider.fetch_rates()
+    assert StubRateHandler.requests == 2
+    assert provider.get_metrics().circuit_open_rejections == 1
+    await provider.close()
+
+
+async def test_stale_rate_used_when_source_is_down(container, stub_server, rate_keys):
+    provider = make_provider(container, stub_server, rate_provider_retries=0)
+    assert await provider.get_rate("USD") == 90.5
+
+    storage = container.redis_repository()
+    for key in rate_keys[:3]:
+        await storage.delete_key(key)
+    StubRateHandler.statuses = [500]
+
+    assert await provider.get_rate("USD") == 90.5
+    metrics = provider.get_metrics()
+    assert metrics.stale_fallbacks == 1
+    assert metrics.cache_misses == 2
+    await provider.close()
+
+
+async def test_concurrent_callers_share_one_rate_fetch(
+    container, monkeypatch, rate_keys
+):
+    fetches = 0
+
+    async def fetch_rates():
+        nonlocal fetches
+        fetches += 1
+        await asyncio.sleep(0.1)
+        return {"USD": 90.5, "EUR": 98.25}
+
+    provider = container.rate_provider()
+    monkeypatch.setattr(provider, "fetch_rates", fetch_rates)
+
+    rates = await asyncio.gather(
+        *(provider.get_rate("USD") for _ in range(5)), provider.get_rate("EUR")
+    )
+
+    assert rates == [90.5] * 5 + [98.25]
+    assert fetches == 1
+
+
+async def test_failed_rate_fetch_is_not_retried_immediately(
+    container, monkeypatch, rate_keys
+):
+    fetches = 0
+
+    async def fetch_rates():
+        nonlocal fetches
+        fetches += 1
+        raise RuntimeError("rate source is down")
+
+    provider = container.rate_provider()
+    monkeypatch.setattr(provider, "fetch_rates", fetch_rates)
+
+    assert await provider.get_rate("USD") is None
+    assert await provider.get_rate("USD") is None
+    assert fetches == 1
+
+
+async def test_slow_fetch_keeps_the_lock(container, monkeypatch, rate_keys):
+    fetches = 0
+
+    async def fetch_rates():
+        nonlocal fetches
+        fetches += 1
+        await asyncio.sleep(1.5)
+        return {"USD": 90.5, "EUR": 98.25}
+
+    config = settings.copy(
+        update={
+            "rate_fetch_lock_timeout": 1,
+            "rate_provider_retries": 0,
+            "rate_provider_connect_timeout": 1.0,
+            "rate_provider_read_timeout": 1.0,
+        }
+    )
+    # Separate providers stand in for separate processes.
+    providers = [
+        RateProvider(temp_storage=container.redis_repository(), config=config)
+        for _ in range(3)
+    ]
+    for provider in providers:
+        monkeypatch.setattr(provider, "fetch_rates", fetch_rates)
+
+    async def get_rate_later(provider: RateProvider, delay: float):
+        await asyncio.sleep(delay)
+        return await provider.get_rate("USD")
+
+    rates = await asyncio.gather(
+        get_rate_later(providers[0], 0),
+        get_rate_later(providers[1], 0.1),
+        get_rate_later(providers[2], 1.2),
+    )
+
+    assert providers[0].get_fetch_lock_ttl() > config.rate_fetch_lock_timeout + 1.5
+    assert rates == [90.5] * 3
+    assert fetches == 1
+    for provider in providers:
+        await provider.close()
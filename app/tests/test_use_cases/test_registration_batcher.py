@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+from sqlalchemy import event
+
+from app.core.settings import settings
+from app.schemas import PackageCreate, PackageResponse
+from app.services.use_cases.registration_batcher import RegistrationBatcher
+
+pytestmark = pytest.mark.asyncio
+
+USER_ID = "34447757-bc8f-447d-b7c8-960f7476c436"
+OTHER_USER_ID = "35cc6b42-55fe-43f0-a8a2-a8ac7105616f"
+
+
+def make_package(number: int, type_id: int = 1) -> PackageCreate:
+    return PackageCreate(
+        name=f"Package {number}", weight=1.5, content_value=100.0, type_id=type_id
+    )
+
+
+class FailingBatchRepository:
+    def __init__(self):
+        self.next_id = 0
+
+    async def register_packages_for_users(self, registrations):
+        raise ValueError("batch failed")
+
+    async def register_package(self, package_data, user_id):
+        if package_data.type_id == 99:
+            raise ValueError("unknown package type")
+        self.next_id += 1
+        return PackageResponse(id=self.next_id)
+
+
+async def test_concurrent_registrations_share_one_commit(container):
+    repository = container.repository()
+    batcher = RegistrationBatcher(
+        repository,
+        settings.copy(
+            update={
+                "register_group_commit_window": 0.05,
+                "register_group_commit_max_batch": 10,
+            }
+        ),
+    )
+    user_ids = [USER_ID if number % 2 else OTHER_USER_ID for number in range(15)]
+
+    package_ids = await asyncio.gather(
+        *(
+            batcher.register(make_package(number), user_id)
+            for number, user_id in enumerate(user_ids)
+        )
+    )
+
+    assert len(set(package_ids)) == 15
+    for number, (package_id, user_id) in enumerate(zip(package_ids, user_ids)):
+        package = await repository.get_package(user_id, package_id)
+        assert package.name == f"Package {number}"
+
+
+async def test_group_commit_ids_with_auto_increment_increment(
+    container, engine_async
+):
+    def set_increment(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("SET SESSION auto_increment_increment = 2")
+        cursor.close()
+
+    await engine_async.dispose()
+    event.listen(engine_async.sync_engine, "connect", set_increment)
+    repository = container.repository()
+    batcher = RegistrationBatcher(
+        repository,
+        settings.copy(update={"register_group_commit_window": 0.05}),
+    )
+    user_ids = [USER_ID if number % 3 else OTHER_USER_ID for number in range(9)]
+    try:
+        package_ids = await asyncio.gather(
+            *(
+                batcher.register(make_package(number), user_id)
+                for number, user_id in enumerate(user_ids)
+            )
+        )
+    finally:
+        event.remove(engine_async.sync_engine, "connect", set_increment)
+        await engine_async.dispose()
+
+    assert len(set(package_ids)) == 9
+    for number, (package_id, user_id) in enumerate(zip(package_ids, user_ids)):
+        package = await repository.get_package(user_id, package_id)
+        assert package.name == f"Package {number}"
+
+
+async def test_failed_batch_falls_back_to_single_registrations():
+    batcher = RegistrationBatcher(FailingBatchRepository(), settings)
+
+    results = await asyncio.gather(
+        batcher.register(make_package(1), USER_ID),
+        batcher.register(make_package(2, type_id=99), USER_ID),
+        batcher.register(make_package(3), USER_ID),
+        return_exceptions=True,
+    )
+
+    assert results[0] == 1
+    assert isinstance(results[1], ValueError)
+    assert results[2] == 2
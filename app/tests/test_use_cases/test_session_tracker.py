@@ -0,0 +1,51 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+from starlette import status
+
+from app.core.settings import settings
+from app.infrastructure.models import User
+from app.services.use_cases.session_tracker import SessionTracker
+
+pytestmark = pytest.mark.asyncio
+
+USER_ID = "34447757-bc8f-447d-b7c8-960f7476c436"
+
+
+async def get_last_access_time(session_factory_async, user_id: str) -> datetime:
+    async with session_factory_async() as session:
+        result = await session.execute(
+            select(User.last_access_time).where(User.id == user_id)
+        )
+        return result.scalar_one()
+
+
+async def test_start_session_creates_user(client, session_factory_async):
+    response = await client.get(url="/start_session")
+    assert response.status_code == status.HTTP_200_OK
+    session_id = response.json()["session_id"]
+
+    assert await get_last_access_time(session_factory_async, session_id) is not None
+
+    response = await client.get(
+        url="/start_session", cookies={"session_id": session_id}
+    )
+    assert response.json()["session_id"] == session_id
+
+
+async def test_last_access_is_buffered(container, session_factory_async):
+    tracker = SessionTracker(
+        container.repository(),
+        settings.copy(update={"last_access_flush_interval": 3600}),
+    )
+    await tracker.track(USER_ID)
+    first_access = await get_last_access_time(session_factory_async, USER_ID)
+
+    await tracker.track(USER_ID)
+    assert tracker.last_access
+    assert await get_last_access_time(session_factory_async, USER_ID) == first_access
+
+    await tracker.close()
+    assert not tracker.last_access
+    assert await get_last_access_time(session_factory_async, USER_ID) >= first_access